@@ -0,0 +1,8 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+Load-test harness, see benchmarks.loadtest
+"""
@@ -0,0 +1,548 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+End-to-end load test.
+
+Drives simpleo.app in-process through ASGI (with lifespan) or a running
+server over HTTP, reports RPS and latency percentiles per endpoint and
+writes/compares JSON baselines.
+
+Scenarios:
+    login-storm   concurrent logins of a few users (bcrypt bound)
+    read-mix      authenticated reads: news pages, news by id, /auth/me
+    write-churn   create/update/delete of own news
+
+Backends (in-process only):
+    memory        real TDGs on in-memory EdgeDB client and fakeredis, no services needed
+    live          EdgeDB and Redis from settings
+
+Settings are read from environment as usual, see .env.example. Scenarios
+register and log in from one address far above production rate limits, so
+the in-process app runs with RATE_LIMIT_ENABLED off unless --rate-limit is
+given. A server driven by --url must be started with RATE_LIMIT_ENABLED=False.
+
+Usage:
+    python -m benchmarks.loadtest read-mix --backend memory -c 32 -d 10 --output read-mix.json
+    python -m benchmarks.loadtest read-mix --backend memory --compare read-mix.json
+    python -m benchmarks.loadtest read-mix --url http://localhost:8000
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Protocol
+from urllib.parse import urlsplit
+
+API = "/api/v1"
+
+
+@dataclass
+class HTTPResponse:
+    """
+    Response of a driver
+    """
+    status: int
+    headers: dict[str, str]
+    body: bytes
+
+    def json(self) -> Any:
+        """
+        Decoded JSON body
+        :return:
+        """
+        return json.loads(self.body)
+
+
+class Driver(Protocol):
+    """
+    Sends requests to the app
+    """
+
+    async def start(self) -> None:
+        ...
+
+    async def stop(self) -> None:
+        ...
+
+    async def request(self, method: str, path: str, headers: dict[str, str] | None = None,
+                      payload: Any = None) -> HTTPResponse:
+        ...
+
+
+class ASGIDriver:
+    """
+    Calls ASGI app in-process, runs its lifespan on start/stop
+    """
+
+    def __init__(self, app: Callable) -> None:
+        self.app = app
+        self._lifespan_queue: asyncio.Queue = asyncio.Queue()
+        self._lifespan_events: asyncio.Queue = asyncio.Queue()
+        self._lifespan_task: asyncio.Task | None = None
+
+    async def _lifespan(self, message_type: str) -> None:
+        await self._lifespan_queue.put({"type": f"lifespan.{message_type}"})
+        message = await self._lifespan_events.get()
+        if message["type"] != f"lifespan.{message_type}.complete":
+            raise RuntimeError(f"Lifespan {message_type} failed: {message.get('message')}")
+
+    async def start(self) -> None:
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self._lifespan_task = asyncio.create_task(
+            self.app(scope, self._lifespan_queue.get, self._lifespan_events.put)
+        )
+        await self._lifespan("startup")
+
+    async def stop(self) -> None:
+        await self._lifespan("shutdown")
+        await self._lifespan_task
+
+    async def request(self, method: str, path: str, headers: dict[str, str] | None = None,
+                      payload: Any = None) -> HTTPResponse:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        raw_headers = [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                       for name, value in (headers or {}).items()]
+        raw_headers.append((b"host", b"loadtest"))
+        if payload is not None:
+            raw_headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        url = urlsplit(path)
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": url.path,
+            "raw_path": url.path.encode("utf-8"),
+            "query_string": url.query.encode("utf-8"),
+            "root_path": "",
+            "headers": raw_headers,
+            "server": ("loadtest", 80),
+            "client": ("127.0.0.1", 50000),
+        }
+        request_sent = False
+        response_done = asyncio.Event()
+        status, response_headers, chunks = 0, {}, []
+
+        async def receive() -> dict:
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await response_done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message: dict) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers.update((name.decode("latin-1"), value.decode("latin-1"))
+                                        for name, value in message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    response_done.set()
+
+        await self.app(scope, receive, send)
+        response_done.set()
+        return HTTPResponse(status, response_headers, b"".join(chunks))
+
+
+class SocketDriver:
+    """
+    Calls running server over HTTP with keep-alive connections
+    """
+
+    def __init__(self, base_url: str, connections: int) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.connections = connections
+        self._session = None
+
+    async def start(self) -> None:
+        import aiohttp  # pylint: disable=import-outside-toplevel
+
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.connections))
+
+    async def stop(self) -> None:
+        await self._session.close()
+
+    async def request(self, method: str, path: str, headers: dict[str, str] | None = None,
+                      payload: Any = None) -> HTTPResponse:
+        async with self._session.request(method, self.base_url + path, headers=headers, json=payload) as response:
+            return HTTPResponse(response.status, dict(response.headers), await response.read())
+
+
+class Recorder:
+    """
+    Latency samples and errors per endpoint
+    """
+
+    def __init__(self) -> None:
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.enabled = False
+
+    async def call(self, driver: Driver, name: str, method: str, path: str,
+                   expected: tuple[int, ...] = (200,), **kwargs: Any) -> HTTPResponse | None:
+        """
+        Send request and record it under endpoint name
+        :return: Response or None if request failed
+        """
+        started_at = time.perf_counter()
+        try:
+            response = await driver.request(method, path, **kwargs)
+        except Exception:  # pylint: disable=broad-except
+            response = None
+        elapsed = time.perf_counter() - started_at
+        ok = response is not None and response.status in expected
+        if self.enabled:
+            self.latencies[name].append(elapsed)
+            if not ok:
+                self.errors[name] += 1
+        return response if ok else None
+
+
+@dataclass
+class Context:
+    """
+    Shared scenario state
+    """
+    driver: Driver
+    recorder: Recorder
+    run_id: str = field(default_factory=lambda: uuid.uuid4().hex[:6])
+    users: list[dict] = field(default_factory=list)
+    news_ids: list[str] = field(default_factory=list)
+
+    async def register(self, index: int) -> dict:
+        """
+        Register user and remember credentials and tokens
+        :param index:
+        :return:
+        """
+        credentials = {"username": f"bench{self.run_id}{index}", "password": "bench-password"}
+        response = await self.driver.request(
+            "POST", f"{API}/auth/register", payload={**credentials, "email": f"{credentials['username']}@bench.local"}
+        )
+        if response.status != 200:
+            raise RuntimeError(f"Register failed: {response.status} {response.body[:200]!r}")
+        user = {**credentials, "headers": {"Authorization": f"Bearer {response.json()['access_token']}"}}
+        self.users.append(user)
+        return user
+
+
+class Scenario:
+    """
+    Load scenario: setup once, then every worker repeats step
+    """
+    name: str = ""
+
+    async def setup(self, context: Context) -> None:
+        """
+        Prepare data, requests are not recorded
+        """
+
+    async def step(self, context: Context, worker: "Worker") -> None:
+        """
+        Send one request
+        """
+        raise NotImplementedError
+
+
+@dataclass
+class Worker:
+    """
+    Per-worker state
+    """
+    index: int
+    rng: random.Random
+    own_news: list[str] = field(default_factory=list)
+
+
+class LoginStorm(Scenario):
+    """
+    Many concurrent logins of a few users
+    """
+    name = "login-storm"
+    users = 8
+
+    async def setup(self, context: Context) -> None:
+        for index in range(self.users):
+            await context.register(index)
+
+    async def step(self, context: Context, worker: Worker) -> None:
+        user = worker.rng.choice(context.users)
+        await context.recorder.call(
+            context.driver, "POST /auth/login", "POST", f"{API}/auth/login",
+            payload={"username": user["username"], "password": user["password"]},
+        )
+
+
+class ReadMix(Scenario):
+    """
+    Authenticated reads of news and current user
+    """
+    name = "read-mix"
+    news = 200
+
+    async def setup(self, context: Context) -> None:
+        user = await context.register(0)
+        for index in range(self.news):
+            response = await context.driver.request(
+                "POST", f"{API}/news/", headers=user["headers"],
+                payload={"title": f"Bench news {index}", "content": f"Content of bench news {index} " * 20},
+            )
+            if response.status != 200:
+                raise RuntimeError(f"Create news failed: {response.status} {response.body[:200]!r}")
+            context.news_ids.append(response.json()["id"])
+
+    async def step(self, context: Context, worker: Worker) -> None:
+        headers = context.users[0]["headers"]
+        roll = worker.rng.random()
+        if roll < 0.5:
+            await context.recorder.call(context.driver, "GET /news/", "GET", f"{API}/news/", headers=headers)
+        elif roll < 0.6:
+            await context.recorder.call(context.driver, "GET /news/?fields", "GET",
+                                        f"{API}/news/?fields=id,title,created_at", headers=headers)
+        elif roll < 0.9:
+            news_id = worker.rng.choice(context.news_ids)
+            await context.recorder.call(context.driver, "GET /news/{id}", "GET", f"{API}/news/{news_id}",
+                                        headers=headers)
+        else:
+            await context.recorder.call(context.driver, "GET /auth/me", "GET", f"{API}/auth/me", headers=headers)
+
+
+class WriteChurn(Scenario):
+    """
+    Every worker creates, updates and deletes its own news
+    """
+    name = "write-churn"
+    own_news = 5
+
+    async def setup(self, context: Context) -> None:
+        await context.register(0)
+
+    async def step(self, context: Context, worker: Worker) -> None:
+        driver, recorder, headers = context.driver, context.recorder, context.users[0]["headers"]
+        if len(worker.own_news) < self.own_news:
+            if response := await recorder.call(driver, "POST /news/", "POST", f"{API}/news/", headers=headers,
+                                               payload={"title": "Churn", "content": "Churn content"}):
+                worker.own_news.append(response.json()["id"])
+        elif worker.rng.random() < 0.7:
+            news_id = worker.rng.choice(worker.own_news)
+            await recorder.call(driver, "PATCH /news/{id}", "PATCH", f"{API}/news/{news_id}", headers=headers,
+                                payload={"title": f"Churn {worker.rng.random()}"})
+        else:
+            news_id = worker.own_news.pop(worker.rng.randrange(len(worker.own_news)))
+            await recorder.call(driver, "DELETE /news/{id}", "DELETE", f"{API}/news/{news_id}", headers=headers)
+
+
+SCENARIOS: dict[str, type[Scenario]] = {scenario.name: scenario for scenario in (LoginStorm, ReadMix, WriteChurn)}
+
+
+def percentile(samples: list[float], percent: float) -> float:
+    """
+    Nearest-rank percentile of sorted samples
+    :param samples:
+    :param percent:
+    :return:
+    """
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, max(0, round(percent / 100 * len(samples)) - 1))]
+
+
+def summarize(latencies: list[float], errors: int, duration: float) -> dict[str, float]:
+    """
+    Throughput and latency of one endpoint, milliseconds
+    """
+    samples = sorted(latencies)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "rps": round(len(samples) / duration, 2),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3) if samples else 0.0,
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+async def run(driver: Driver, scenario: Scenario, concurrency: int, duration: float, warmup: float,
+              seed: int) -> tuple[Recorder, float]:
+    """
+    Run scenario: setup, warm-up without recording, then measured run
+    :return: Recorder and measured duration
+    """
+    recorder = Recorder()
+    context = Context(driver, recorder)
+    await scenario.setup(context)
+    workers = [Worker(index, random.Random(seed + index)) for index in range(concurrency)]
+
+    async def loop(worker: Worker, deadline: float) -> None:
+        while time.perf_counter() < deadline:
+            await scenario.step(context, worker)
+
+    if warmup > 0:
+        deadline = time.perf_counter() + warmup
+        await asyncio.gather(*(loop(worker, deadline) for worker in workers))
+
+    recorder.enabled = True
+    started_at = time.perf_counter()
+    await asyncio.gather(*(loop(worker, started_at + duration) for worker in workers))
+    return recorder, time.perf_counter() - started_at
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_report(args: argparse.Namespace, recorder: Recorder, duration: float) -> dict:
+    """
+    JSON report of a run
+    """
+    all_latencies = [sample for samples in recorder.latencies.values() for sample in samples]
+    backend = "http" if args.url else args.backend
+    if backend == "memory":
+        from benchmarks.memory import NOTE as note  # pylint: disable=import-outside-toplevel
+    else:
+        note = None
+    return {
+        "meta": {
+            "scenario": args.scenario,
+            "backend": backend,
+            "note": note,
+            "concurrency": args.concurrency,
+            "duration": round(duration, 3),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        },
+        "total": summarize(all_latencies, sum(recorder.errors.values()), duration),
+        "endpoints": {
+            name: summarize(samples, recorder.errors[name], duration)
+            for name, samples in sorted(recorder.latencies.items())
+        },
+    }
+
+
+def print_report(report: dict) -> None:
+    """
+    Report as table
+    """
+    meta = report["meta"]
+    print(f"{meta['scenario']} on {meta['backend']}, concurrency {meta['concurrency']}, {meta['duration']} s")
+    if meta.get("note"):
+        print(f"Note: {meta['note']}")
+    print(f"{'endpoint':<24}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in [*report["endpoints"].items(), ("total", report["total"])]:
+        print(f"{name:<24}{stats['requests']:>10}{stats['errors']:>8}{stats['rps']:>10.1f}"
+              f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> bool:
+    """
+    Print difference with baseline
+    :param report:
+    :param baseline:
+    :param threshold: Allowed regression of p95 and RPS, percent
+    :return: True if there is no regression above threshold
+    """
+    ok = True
+    print(f"\nCompared with {baseline['meta'].get('commit')} (threshold {threshold:.0f}%)")
+    endpoints = {**report["endpoints"], "total": report["total"]}
+    base_endpoints = {**baseline["endpoints"], "total": baseline["total"]}
+    for name, stats in endpoints.items():
+        if not (base := base_endpoints.get(name)):
+            print(f"{name:<24} new endpoint")
+            continue
+        p95_change = (stats["p95_ms"] / base["p95_ms"] - 1) * 100 if base["p95_ms"] else 0.0
+        rps_change = (stats["rps"] / base["rps"] - 1) * 100 if base["rps"] else 0.0
+        regressed = p95_change > threshold or rps_change < -threshold
+        ok = ok and not regressed
+        print(f"{name:<24} p95 {p95_change:+7.1f}%  rps {rps_change:+7.1f}%{'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    Command line options
+    """
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.loadtest", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--backend", choices=("memory", "live"), default="memory")
+    parser.add_argument("--url", help="Base URL of running server, app is not started in-process")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("-d", "--duration", type=float, default=10.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Unmeasured seconds before run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON report to file")
+    parser.add_argument("--compare", help="Baseline JSON report to compare with")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed regression, percent")
+    parser.add_argument("--rate-limit", action="store_true", help="Keep rate limits of in-process app on")
+    return parser.parse_args(argv)
+
+
+async def amain(args: argparse.Namespace) -> dict:
+    """
+    Run load test
+    :return: Report
+    """
+    if args.url:
+        driver: Driver = SocketDriver(args.url, args.concurrency)
+    else:
+        if args.backend == "memory":
+            from benchmarks import memory  # pylint: disable=import-outside-toplevel
+            memory.install()
+        # pylint: disable=import-outside-toplevel
+        from simpleo.app import app
+        from simpleo.core.config import settings
+        settings.RATE_LIMIT_ENABLED = args.rate_limit
+        driver = ASGIDriver(app)
+
+    await driver.start()
+    try:
+        recorder, duration = await run(
+            driver, SCENARIOS[args.scenario](), args.concurrency, args.duration, args.warmup, args.seed
+        )
+    finally:
+        await driver.stop()
+    return build_report(args, recorder, duration)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Entrypoint
+    :return: Exit code
+    """
+    args = parse_args(argv)
+    report = asyncio.run(amain(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            return int(not compare(report, json.load(file), args.threshold))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,311 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+In-memory backend.
+
+Puts MemoryDatabase under the EdgeDB DatabaseClient and fakeredis under the
+Redis manager. TDGs, caches, background tasks and everything above them run
+unchanged, only query execution is emulated, so results show the cost of the
+application itself without database round trips.
+
+MemoryDatabase answers the queries TDGs issue, recognized by their text.
+A query it doesn't know raises UnsupportedQueryError, so changes of TDG
+queries are noticed instead of being benchmarked against stale code.
+
+Access policies are not emulated: user-bound clients see everything, so
+failures that only the policies cause (like reading the author of another
+user's news through a bound client) don't show up here. Reports of this
+backend carry NOTE, check such changes on the live backend.
+"""
+
+import datetime
+import json
+import re
+import uuid
+from typing import Any, AsyncIterator, Callable
+from uuid import UUID
+
+import edgedb
+
+_WHITESPACE = re.compile(r"\s+")
+
+NOTE = "access policies are not emulated, policy failures of user-bound queries don't show up"
+
+
+class UnsupportedQueryError(RuntimeError):
+    """
+    Query is not known to MemoryDatabase
+    """
+
+
+class Row:
+    """
+    Result object with attribute access, like edgedb.Object
+    """
+
+    def __init__(self, **fields: Any) -> None:
+        self.__dict__.update(fields)
+
+    def __dir__(self) -> list[str]:
+        return list(self.__dict__)
+
+
+class MemoryStore:
+    """
+    Users and news kept in dicts
+    """
+
+    def __init__(self) -> None:
+        self.users: dict[UUID, dict[str, Any]] = {}
+        self.user_ids: dict[str, UUID] = {}
+        self.news: dict[UUID, dict[str, Any]] = {}
+
+    def user_row(self, user_id: UUID) -> Row:
+        """
+        User as linked from news, without password
+        :param user_id:
+        :return:
+        """
+        user = self.users[user_id]
+        return Row(**{name: user[name] for name in ("id", "username", "email", "created_at", "updated_at")})
+
+    def news_row(self, news_id: UUID, **extra: Any) -> Row:
+        """
+        News with its author
+        :param news_id:
+        :param extra: Computed fields
+        :return:
+        """
+        news = self.news[news_id]
+        return Row(**{name: value for name, value in news.items() if name != "user_id"},
+                   user=self.user_row(news["user_id"]), **extra)
+
+    def newest_first(self, user_id: UUID | None = None, title: str | None = None) -> list[dict[str, Any]]:
+        """
+        News ordered as NewsTDG orders them
+        :param user_id:
+        :param title:
+        :return:
+        """
+        news = [item for item in self.news.values()
+                if (user_id is None or item["user_id"] == user_id) and (title is None or item["title"] == title)]
+        return sorted(news, key=lambda item: (item["created_at"], item["id"]), reverse=True)
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class _Transaction:
+    """
+    Transaction of MemoryDatabase, changes are not rolled back
+    """
+
+    def __init__(self, database: "MemoryDatabase") -> None:
+        self.database = database
+
+    async def __aenter__(self) -> "_Transaction":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> bool:
+        return False
+
+    async def query(self, query: str, **kwargs: Any) -> list:
+        return await self.database.query(query, **kwargs)
+
+
+class MemoryDatabase:
+    """
+    Emulates edgedb.AsyncIOClient for queries of TDGs
+    """
+
+    def __init__(self, store: MemoryStore, current_user_id: UUID | None = None) -> None:
+        self.store = store
+        self.current_user_id = current_user_id
+        # Checked in order, the first pattern found in normalized query text wins
+        self.handlers: list[tuple[re.Pattern, Callable[..., list]]] = [
+            (re.compile(pattern), handler) for pattern, handler in (
+                (r"insert auth::User", self._insert_user),
+                (r"select global auth::current_user", self._current_user),
+                (r"select auth::User .* filter \.username", self._user_by_username),
+                (r"select auth::User .* filter \.id =", self._user_by_id),
+                (r"select auth::User .* offset", self._users),
+                (r"fts::search\(news::News", self._search_news),
+                (r"json_array_unpack.*insert news::News", self._bulk_insert_news),
+                (r"insert news::News", self._insert_news),
+                (r"json_array_unpack.*update news::News", self._bulk_update_news),
+                (r"update news::News", self._update_news),
+                (r"delete news::News filter \.id in", self._delete_many_news),
+                (r"delete news::News", self._delete_news),
+                (r"select news::News .* filter \.id in array_unpack", self._news_by_ids),
+                (r"select news::News .* filter \.id = <uuid>\$news_id", self._news_by_id),
+                (r"select news::News .* order by \.created_at", self._news_page),
+            )
+        ]
+
+    def with_globals(self, globals_: dict[str, Any]) -> "MemoryDatabase":
+        """
+        Same database with bound current user
+        :param globals_:
+        :return:
+        """
+        return MemoryDatabase(self.store, globals_.get("auth::current_user_id"))
+
+    async def query(self, query: str, **kwargs: Any) -> list:
+        """
+        Run query of a TDG
+        :param query:
+        :param kwargs:
+        :return:
+        """
+        text = _WHITESPACE.sub(" ", query).strip()
+        for pattern, handler in self.handlers:
+            if pattern.search(text):
+                return handler(text, **kwargs)
+        raise UnsupportedQueryError(f"Memory backend doesn't support query: {text}")
+
+    async def transaction(self) -> AsyncIterator[_Transaction]:
+        """
+        Single attempt transaction
+        :return:
+        """
+        yield _Transaction(self)
+
+    async def ensure_connected(self) -> "MemoryDatabase":
+        return self
+
+    async def aclose(self) -> None:
+        return None
+
+    def _user_row(self, user: dict[str, Any]) -> Row:
+        return Row(**user)
+
+    def _insert_user(self, _: str, username: str, email: str, password: str) -> list:
+        if username in self.store.user_ids:
+            raise edgedb.errors.ConstraintViolationError("username violates exclusivity constraint")
+        user = {"id": uuid.uuid4(), "created_at": _now(), "updated_at": None,
+                "username": username, "email": email, "password": password}
+        self.store.users[user["id"]] = user
+        self.store.user_ids[username] = user["id"]
+        return [self._user_row(user)]
+
+    def _current_user(self, _: str) -> list:
+        user = self.store.users.get(self.current_user_id)
+        return [self._user_row(user)] if user else []
+
+    def _user_by_username(self, _: str, username: str) -> list:
+        user_id = self.store.user_ids.get(username)
+        return [self._user_row(self.store.users[user_id])] if user_id else []
+
+    def _user_by_id(self, _: str, user_id: UUID) -> list:
+        user = self.store.users.get(user_id)
+        return [self._user_row(user)] if user else []
+
+    def _users(self, _: str, limit: int, offset: int) -> list:
+        return [self._user_row(user) for user in list(self.store.users.values())[offset:offset + limit]]
+
+    def _news_page(self, text: str, user_id: UUID | None, title: str | None,
+                   after_created_at: datetime.datetime | None, after_id: UUID | None,
+                   before_created_at: datetime.datetime | None, before_id: UUID | None, limit: int) -> list:
+        # pylint: disable=too-many-arguments
+        news = self.store.newest_first(user_id, title)
+        if after_created_at is not None:
+            news = [item for item in news if (item["created_at"], item["id"]) < (after_created_at, after_id)]
+        if before_created_at is not None:
+            news = [item for item in news if (item["created_at"], item["id"]) > (before_created_at, before_id)]
+        if "order by .created_at asc" in text:
+            news.reverse()
+        return [self.store.news_row(item["id"]) for item in news[:limit]]
+
+    def _search_news(self, _: str, text: str, user_id: UUID | None, title: str | None,
+                     after_score: float | None, after_id: UUID | None, limit: int) -> list:
+        # pylint: disable=too-many-arguments
+        text = text.lower()
+        score = 1.0
+        news = sorted(
+            (item for item in self.store.newest_first(user_id, title)
+             if text in item["title"].lower() or text in item["content"].lower()),
+            key=lambda item: item["id"],
+        )
+        if after_score is not None:
+            news = [item for item in news if score < after_score or item["id"] > after_id]
+        return [(self.store.news_row(item["id"]), score) for item in news[:limit]]
+
+    def _news_by_id(self, _: str, news_id: UUID) -> list:
+        return [self.store.news_row(news_id)] if news_id in self.store.news else []
+
+    def _news_by_ids(self, _: str, news_ids: list[UUID]) -> list:
+        return [self.store.news_row(news_id) for news_id in news_ids if news_id in self.store.news]
+
+    def _create_news(self, user_id: UUID, title: str, content: str) -> UUID:
+        if user_id not in self.store.users:
+            raise edgedb.errors.MissingRequiredError("missing value for required link 'user'")
+        news = {"id": uuid.uuid4(), "created_at": _now(), "updated_at": None,
+                "user_id": user_id, "title": title, "content": content}
+        self.store.news[news["id"]] = news
+        return news["id"]
+
+    def _insert_news(self, _: str, user_id: UUID, title: str, content: str) -> list:
+        return [self.store.news_row(self._create_news(user_id, title, content))]
+
+    def _bulk_insert_news(self, _: str, user_id: UUID, items: str) -> list:
+        return [
+            self.store.news_row(self._create_news(user_id, item["title"], item["content"]), index=item["index"])
+            for item in json.loads(items)
+        ]
+
+    def _change_news(self, news_id: UUID, title: str | None, content: str | None) -> list:
+        if (news := self.store.news.get(news_id)) is None:
+            return []
+        news.update({
+            "title": title if title is not None else news["title"],
+            "content": content if content is not None else news["content"],
+            "updated_at": _now(),
+        })
+        return [self.store.news_row(news_id)]
+
+    def _update_news(self, _: str, news_id: UUID, title: str | None, content: str | None) -> list:
+        return self._change_news(news_id, title, content)
+
+    def _bulk_update_news(self, _: str, items: str) -> list:
+        return [row for item in json.loads(items)
+                for row in self._change_news(UUID(item["id"]), item.get("title"), item.get("content"))]
+
+    def _delete_news(self, _: str, news_id: UUID) -> list:
+        return self._delete_many_news(_, [news_id])
+
+    def _delete_many_news(self, _: str, news_ids: list[UUID]) -> list:
+        rows = [self.store.news_row(news_id) for news_id in news_ids if news_id in self.store.news]
+        for row in rows:
+            del self.store.news[row.id]
+        return rows
+
+
+def install() -> MemoryStore:
+    """
+    Switch the app to in-memory storage. Call before app startup.
+    :return: Store with app data
+    """
+    # pylint: disable=import-outside-toplevel
+    try:
+        import fakeredis
+    except ImportError as error:
+        raise SystemExit("Memory backend needs dev dependencies: poetry install --with dev") from error
+
+    from simpleo.core.connections.edgedb import client, client_for_user
+    from simpleo.core.connections.redis import redis_manager
+
+    store = MemoryStore()
+    # pylint: disable=protected-access
+    client._client = MemoryDatabase(store)
+    client_for_user.cache_clear()
+
+    server = fakeredis.FakeServer()
+    fake = fakeredis.FakeAsyncRedis(server=server)
+    redis_manager._client = fake
+    redis_manager._pool = fake.connection_pool
+    redis_manager.create_subscriber = lambda: fakeredis.FakeAsyncRedis(server=server)
+    return store
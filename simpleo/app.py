@@ -7,13 +7,26 @@
 Project entrypoint
 """
 
-from fastapi import FastAPI
+import contextlib
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from redis.exceptions import RedisError
 from starlette.middleware.cors import CORSMiddleware
 
 from simpleo.core.config import settings
+from simpleo.core.health import router as health_router
+from simpleo.core.metrics import MetricsMiddleware
+from simpleo.core.queries import QueryLogMiddleware
 from simpleo.core.router import router
 
+from simpleo.auth.hashing import password_hasher
 from simpleo.core.connections.edgedb import client as database_client
+from simpleo.core.connections.redis import redis_manager
+from simpleo.core.connections.table_data_gateways import QueryTimeout
+from simpleo.core.entity_cache import start_invalidation_listener, stop_invalidation_listener
+from simpleo.core.tasks import task_queue
+from simpleo.core.warmup import start_warm_up, stop_warm_up
 
 app = FastAPI(
     title=settings.PROJECT_NAME, openapi_url=f"{settings.API_V1_STR}/openapi.json",
@@ -27,14 +40,49 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_headers=["*"],
     )
 
+app.add_middleware(QueryLogMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(router)
+app.include_router(health_router, tags=["Health"])
+
+
+@app.exception_handler(QueryTimeout)
+async def query_timeout_handler(request: Request, exc: QueryTimeout) -> JSONResponse:
+    """
+    Slow database is reported as unavailable, not as missing data
+    :param request:
+    :param exc:
+    :return:
+    """
+    return JSONResponse(status_code=503, content={"detail": "Service temporarily unavailable."})
+
+
+@app.on_event("startup")
+async def startup() -> None:
+    """
+    Startup function:
+        Check Redis, start background listeners, task workers and warm-up.
+    :return:
+    """
+    # Redis outage must not stop the app, caches fall back to the database
+    with contextlib.suppress(RedisError):
+        await redis_manager.connect()
+    start_invalidation_listener()
+    await task_queue.start()
+    start_warm_up()
 
 
 @app.on_event("shutdown")
 async def shutdown() -> None:
     """
     Shutdown function:
-        Close all connections.
+        Drain background tasks, close all connections.
     :return:
     """
+    await stop_warm_up()
+    await task_queue.stop(timeout=settings.TASK_QUEUE_DRAIN_TIMEOUT)
+    await stop_invalidation_listener()
     await database_client.aclose()
+    await redis_manager.close()
+    password_hasher.shutdown()
@@ -7,13 +7,63 @@
 Decorators depends on auth processes for usage anywhere.
 """
 
-import uuid
 import datetime
+import hashlib
+import uuid
 
 from fastapi import HTTPException, status, Depends
 
 from simpleo.auth import security, schemas
-from simpleo.auth.table_data_gateways.user import UserTDG
+from simpleo.auth.table_data_gateways.user import UserTDG, user_cache
+from simpleo.core.cache import TTLCache
+from simpleo.core.config import settings
+
+access_token_cache: TTLCache[str, tuple[schemas.TokenPayloadSchema, schemas.User]] = TTLCache(
+    maxsize=settings.ACCESS_TOKEN_CACHE_SIZE,
+    max_age=settings.ACCESS_TOKEN_CACHE_MAX_AGE,
+)
+
+
+def _token_cache_key(token: str) -> str:
+    """
+    Make cache key from access token
+    :param token:
+    :return:
+    """
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def invalidate_access_token(token: str) -> None:
+    """
+    Drop verified access token from cache
+    :param token:
+    :return:
+    """
+    access_token_cache.delete(_token_cache_key(token))
+
+
+def invalidate_user_access_tokens(user_id: uuid.UUID) -> None:
+    """
+    Drop all verified access tokens of user from cache of this worker.
+    Runs in every worker on user cache invalidation, use evict_user_access_tokens.
+    :param user_id:
+    :return:
+    """
+    access_token_cache.delete_where(lambda _, value: value[0].sub == user_id)
+
+
+user_cache.add_invalidation_hook(lambda user_id: invalidate_user_access_tokens(uuid.UUID(user_id)))
+
+
+async def evict_user_access_tokens(user_id: uuid.UUID) -> None:
+    """
+    Drop verified access tokens and cached user in every worker, through user cache invalidation.
+    Call it on logout and on every user change. Tokens are verified again on next use,
+    they stay valid until they expire.
+    :param user_id:
+    :return:
+    """
+    await user_cache.invalidate(str(user_id))
 
 
 class AccessControl:
@@ -33,6 +83,13 @@ class AccessControl:
         Check user
         :return:
         """
+        cache_key = _token_cache_key(token)
+        if cached := access_token_cache.get(cache_key):
+            token_data, user = cached
+            if token_data.exp >= datetime.datetime.now().timestamp():
+                return user
+            access_token_cache.delete(cache_key)
+
         success, token_data = await security.decode_token(security.TokenTypeEnum.ACCESS, token)
         if not success or token_data.exp < datetime.datetime.now().timestamp():
             raise HTTPException(
@@ -46,6 +103,11 @@ class AccessControl:
                 detail="Invalid credentials",
             )
 
+        access_token_cache.set(
+            cache_key,
+            (token_data, user),
+            ttl=token_data.exp - datetime.datetime.now().timestamp()
+        )
         return user
 
     async def __call__(self, token: str = Depends(security.reusable_oauth2)) -> schemas.User:
@@ -9,19 +9,25 @@ Auth module endpoints
 
 import datetime
 
-from fastapi import HTTPException, status, Depends
+from fastapi import HTTPException, status, Depends, Request, Response
 from fastapi.routing import APIRouter
 
 from simpleo.auth import schemas, security
-from simpleo.auth.dependencies import AccessControl
+from simpleo.auth.dependencies import AccessControl, evict_user_access_tokens
 from simpleo.auth.schemas import RefreshTokenSchema
 from simpleo.auth.security import decode_token, check_and_revoke_refresh_token, TokenTypeEnum, get_password_hash
 from simpleo.auth.table_data_gateways.user import UserTDG
+from simpleo.core.conditional import make_etag, is_not_modified, not_modified, set_validators
+from simpleo.core.config import settings
+from simpleo.core.rate_limit import RateLimit
+from simpleo.core.routing import FastResponseRoute, ModelJSONResponse
 
-router = APIRouter()
+router = APIRouter(route_class=FastResponseRoute)
 
 
-@router.post('/login', response_model=schemas.AuthTokens)
+@router.post('/login', response_model=schemas.AuthTokens, dependencies=[Depends(RateLimit(
+    "login", ip=settings.RATE_LIMIT_LOGIN_IP, username=settings.RATE_LIMIT_LOGIN_USERNAME
+))])
 async def login(
         login_data: schemas.UserLoginRequestSchema,
 ) -> schemas.AuthTokens:
@@ -34,7 +40,9 @@ async def login(
     return await security.generate_auth_tokens(user.id)
 
 
-@router.post('/register', response_model=schemas.AuthTokens)
+@router.post('/register', response_model=schemas.AuthTokens, dependencies=[Depends(RateLimit(
+    "register", ip=settings.RATE_LIMIT_REGISTER_IP
+))])
 async def register(
         register_data: schemas.UserCreateRequestSchema,
 ) -> schemas.AuthTokens:
@@ -59,15 +67,21 @@ async def register(
 async def logout(*, form_data: RefreshTokenSchema) -> dict:
     success, token_data = await decode_token(TokenTypeEnum.REFRESH, form_data.refresh_token)
     if success and token_data.exp > datetime.datetime.now().timestamp():
-        await check_and_revoke_refresh_token(form_data.refresh_token)
+        await check_and_revoke_refresh_token(form_data.refresh_token, token_data.exp)
+        await evict_user_access_tokens(token_data.sub)
     return {"detail": "Logged out."}
 
 
 @router.get('/me', response_model=schemas.User)
 def get_me(
+        request: Request,
         user: schemas.User = Depends(AccessControl())
-) -> schemas.User:
+) -> Response:
     """
     Return current user
     """
-    return user
+    last_modified = user.updated_at or user.created_at
+    etag = make_etag(user.id, last_modified)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(etag, last_modified)
+    return set_validators(ModelJSONResponse(user), etag, last_modified)
@@ -0,0 +1,193 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+Password hashing service.
+
+bcrypt is CPU bound, so hashing and verifying run in a bounded worker pool
+instead of the event loop.
+"""
+
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from simpleo.core.config import settings
+from simpleo.core.metrics import Gauge, observe, registry
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def _hash(password: str) -> str:
+    """
+    Hash password. Runs inside worker pool.
+    :param password:
+    :return:
+    """
+    return pwd_context.hash(password)
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    """
+    Verify password. Runs inside worker pool.
+    :param plain_password:
+    :param hashed_password:
+    :return:
+    """
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+@dataclass
+class HashingMetrics:
+    """
+    Password hashing metrics
+    """
+    queue_depth: int = 0
+    in_progress: int = 0
+    completed: int = 0
+    failed: int = 0
+    rejected: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    @property
+    def average_seconds(self) -> float:
+        """
+        Average latency of completed hash/verify
+        :return:
+        """
+        return self.total_seconds / self.completed if self.completed else 0.0
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt operations in a worker pool with a concurrency cap.
+
+    Callers waiting for a free slot longer than queue_timeout get 503.
+    """
+
+    def __init__(self,
+                 workers: int,
+                 max_concurrency: int,
+                 queue_timeout: float,
+                 use_processes: bool = False) -> None:
+        """
+        :param workers: size of worker pool
+        :param max_concurrency: maximum of operations submitted to pool at once
+        :param queue_timeout: maximum seconds to wait for a free slot
+        :param use_processes: use process pool instead of thread pool
+        """
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self.use_processes = use_processes
+        self.metrics = HashingMetrics()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._executor: Executor | None = None
+
+    @property
+    def executor(self) -> Executor:
+        """
+        Create worker pool on first usage
+        :return:
+        """
+        if self._executor is None:
+            executor_class = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+            self._executor = executor_class(max_workers=self.workers)
+        return self._executor
+
+    async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Wait for a free slot and run function in worker pool
+        :param func:
+        :param args:
+        :return:
+        """
+        self.metrics.queue_depth += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError as error:
+            self.metrics.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy. Try again later.",
+            ) from error
+        finally:
+            self.metrics.queue_depth -= 1
+
+        self.metrics.in_progress += 1
+        started_at = time.perf_counter()
+        future = asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        future.add_done_callback(lambda done: self._finish(done, started_at))
+        # Cancelled caller doesn't stop the worker, the slot is released when the worker is done
+        return await asyncio.shield(future)
+
+    def _finish(self, future: asyncio.Future, started_at: float) -> None:
+        """
+        Release slot and record result of finished operation
+        :param future:
+        :param started_at:
+        :return:
+        """
+        elapsed = time.perf_counter() - started_at
+        self.metrics.in_progress -= 1
+        # exception() also marks it retrieved when the caller is gone
+        if future.cancelled() or future.exception() is not None:
+            self.metrics.failed += 1
+        else:
+            self.metrics.completed += 1
+            self.metrics.total_seconds += elapsed
+            self.metrics.max_seconds = max(self.metrics.max_seconds, elapsed)
+            observe("bcrypt", elapsed)
+        self._semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        """
+        Hash password
+        :param password:
+        :return:
+        """
+        return await self._run(_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        Verify plain password with hashed password
+        :param plain_password:
+        :param hashed_password:
+        :return:
+        """
+        return await self._run(_verify, plain_password, hashed_password)
+
+    def shutdown(self) -> None:
+        """
+        Shutdown worker pool without blocking the event loop, running operations finish in background
+        :return:
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASHING_WORKERS,
+    max_concurrency=settings.PASSWORD_HASHING_MAX_CONCURRENCY,
+    queue_timeout=settings.PASSWORD_HASHING_QUEUE_TIMEOUT,
+    use_processes=settings.PASSWORD_HASHING_USE_PROCESSES,
+)
+
+registry.register(Gauge(
+    "simpleo_password_hashing", "Password hashing queue and results", ("stat",),
+    function=lambda: {
+        ("queue_depth",): password_hasher.metrics.queue_depth,
+        ("in_progress",): password_hasher.metrics.in_progress,
+        ("completed",): password_hasher.metrics.completed,
+        ("failed",): password_hasher.metrics.failed,
+        ("rejected",): password_hasher.metrics.rejected,
+    },
+))
@@ -27,6 +27,13 @@ class User(Auditable):
     password: str = Field(exclude=True)
 
 
+class PublicUser(User):
+    """
+    User without password hash, kept in shared caches
+    """
+    password: str | None = Field(None, exclude=True)
+
+
 class UserCreateRequestSchema(BaseModel):
     """
     User create request schema
@@ -11,26 +11,27 @@ Security functions
 
 import binascii
 import enum
+import hashlib
 import json
+import math
 from datetime import datetime, timedelta
 from typing import Any
 
 import pyseto
-from fastapi import HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 from pydantic import ValidationError
 
 from simpleo.auth import schemas
+from simpleo.auth.hashing import password_hasher
 from simpleo.auth.schemas import TokenPayloadSchema
 from simpleo.core.config import settings
 from simpleo.core.connections.redis import redis
+from simpleo.core.metrics import timed
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/auth/login"
 )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 ALGORITHM = "HS256"
 
 
@@ -42,23 +43,27 @@ class TokenTypeEnum(enum.Enum):
     REFRESH = "REFRESH"
 
 
-async def check_and_revoke_refresh_token(token: str) -> bool:
+def _refresh_token_revocation_key(token: str) -> str:
     """
-    Check if refresh token in blacklist.
-    If refresh token not in blacklist it will put token to blacklist.
+    Make revocation key from refresh token digest
     :param token:
     :return:
     """
-    is_token_in_blacklist = await redis.sismember("refresh-token-blacklist", token)
-    if is_token_in_blacklist:
-        return True
-    adding_status = await redis.sadd("refresh-token-blacklist", token)
-    if adding_status == 0:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Something went wrong. Try again later.",
-        )
-    return False
+    return f"refresh-token-revoked:{hashlib.sha256(token.encode('utf-8')).hexdigest()}"
+
+
+async def check_and_revoke_refresh_token(token: str, expires_at: float) -> bool:
+    """
+    Check if refresh token is revoked.
+    If refresh token is not revoked it will be revoked until its expiration.
+    Check and revoke are done by one atomic SET NX.
+    :param token:
+    :param expires_at: token expiration timestamp
+    :return:
+    """
+    ttl = max(math.ceil(expires_at - datetime.now().timestamp()), 1)
+    is_revoked_now = await redis.set(_refresh_token_revocation_key(token), 1, nx=True, ex=ttl)
+    return not is_revoked_now
 
 
 async def decode_token(token_type: TokenTypeEnum, token: str) -> tuple[bool, None | TokenPayloadSchema]:
@@ -68,9 +73,11 @@ async def decode_token(token_type: TokenTypeEnum, token: str) -> tuple[bool, Non
     :param token:
     :return:
     """
-    private_key = settings.__dict__[f"PRIVATE_PUBLIC_{token_type.value}_KEY"]
+    private_key = getattr(settings, f"PRIVATE_PUBLIC_{token_type.value}_KEY")
     try:
-        payload = json.loads(pyseto.decode(private_key, token).payload.decode("utf-8"))
+        with timed("paseto_verify"):
+            decoded = pyseto.decode(private_key, token)
+        payload = json.loads(decoded.payload.decode("utf-8"))
         token_data = schemas.TokenPayloadSchema(**payload)
     except (pyseto.DecryptError,
             pyseto.VerifyError,
@@ -91,7 +98,7 @@ async def create_token(token_type: TokenTypeEnum,
     :param expires_delta:
     :return:
     """
-    private_key = settings.__dict__[f"PRIVATE_SECRET_{token_type.value}_KEY"]
+    private_key = getattr(settings, f"PRIVATE_SECRET_{token_type.value}_KEY")
     expire_key_minutes = settings.__dict__.get(f"{token_type.value}_TOKEN_EXPIRE_MINUTES", None)
 
     expire = None
@@ -106,7 +113,8 @@ async def create_token(token_type: TokenTypeEnum,
         "exp": expire.timestamp() if expire else None,
         "sub": str(subject)
     }
-    return pyseto.encode(private_key, json.dumps(to_encode)).decode("utf-8")
+    with timed("paseto_sign"):
+        return pyseto.encode(private_key, json.dumps(to_encode)).decode("utf-8")
 
 
 async def generate_auth_tokens(subject: Any) -> schemas.AuthTokens:
@@ -131,7 +139,7 @@ async def verify_password(plain_password: str, hashed_password: str) -> bool:
     :param hashed_password:
     :return:
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    return await password_hasher.verify(plain_password, hashed_password)
 
 
 async def get_password_hash(password: str) -> str:
@@ -140,4 +148,4 @@ async def get_password_hash(password: str) -> str:
     :param password:
     :return:
     """
-    return pwd_context.hash(password)
+    return await password_hasher.hash(password)
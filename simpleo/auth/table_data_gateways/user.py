@@ -12,11 +12,23 @@ import uuid
 import edgedb.errors
 
 from simpleo.auth.schemas import (
+    PublicUser,
     User,
     UserCreateRequestSchema
 )
+from simpleo.core.config import settings
 from simpleo.core.connections.table_data_gateways import BaseTableDataGateway
-from simpleo.core.utils import make_pydantic_model
+from simpleo.core.entity_cache import EntityCache
+from simpleo.core.utils import make_pydantic_model, make_pydantic_models
+
+# Without password hash, it is not needed after login, which reads users by username
+user_cache: EntityCache[PublicUser] = EntityCache(
+    namespace="user",
+    model=PublicUser,
+    ttl=settings.USER_CACHE_TTL,
+    l1_maxsize=settings.USER_CACHE_L1_SIZE,
+    l1_max_age=settings.USER_CACHE_L1_MAX_AGE,
+)
 
 
 class UserTDG(BaseTableDataGateway):
@@ -24,6 +36,13 @@ class UserTDG(BaseTableDataGateway):
     User TDG
     """
 
+    warmup_calls = (
+        ("get_all", {}),
+        ("get_by_username", {"username": ""}),
+        ("get_by_id", {"user_id": uuid.UUID(int=0)}),
+        ("get_current_user", {}),
+    )
+
     async def get_all(self, limit: int = 20, offset: int = 0) -> list[User]:
         """
         Get all users from db
@@ -32,7 +51,7 @@ class UserTDG(BaseTableDataGateway):
         query = """
         select auth::User { * } offset <int64>$offset limit <int64>$limit
         """
-        return await self.database.query(query, limit=limit, offset=offset)
+        return make_pydantic_models(User, await self.database.query(query, limit=limit, offset=offset))
 
     async def get_by_username(self, username: str = "") -> User | None:
         """
@@ -44,33 +63,47 @@ class UserTDG(BaseTableDataGateway):
         select auth::User { * } filter .username ?= <str>$username
         """
         if result := await self.database.query(query, username=username):
-            return result[0]
+            return make_pydantic_model(User, result[0])
         return None
 
-    async def get_by_id(self, user_id: uuid.UUID) -> User | None:
+    async def get_by_id(self, user_id: uuid.UUID) -> PublicUser | None:
         """
-        Get user by id
+        Get user by id, without password hash
         :param user_id:
         :return:
         """
         query = """
         select auth::User { * } filter .id = <uuid>$user_id
         """
-        if result := await self.database.query(query, user_id=user_id):
-            return make_pydantic_model(User, result[0])
-        return None
 
-    async def get_current_user(self) -> User | None:
+        async def load() -> PublicUser | None:
+            if result := await self.database.query(query, user_id=user_id):
+                return make_pydantic_model(PublicUser, result[0])
+            return None
+
+        # Access policies hide other users from bound clients, so cache is shared only
+        # between unbound and own lookups
+        if self.user_id not in (None, user_id):
+            return await load()
+        return await user_cache.get_or_load(str(user_id), load)
+
+    async def get_current_user(self) -> PublicUser | None:
         """
-        Get current user by global variable
+        Get current user by global variable, without password hash
         :return:
         """
         query = """
         select global auth::current_user {*};
         """
-        if result := await self.database.query(query):
-            return make_pydantic_model(User, result[0])
-        return None
+
+        async def load() -> PublicUser | None:
+            if result := await self.coalesced_query(query):
+                return make_pydantic_model(PublicUser, result[0])
+            return None
+
+        if self.user_id is None:
+            return await load()
+        return await user_cache.get_or_load(str(self.user_id), load)
 
     async def create(self, user: UserCreateRequestSchema) -> User | None:
         """
@@ -94,4 +127,4 @@ class UserTDG(BaseTableDataGateway):
             created_user = (await self.database.query(query, **user.model_dump()))[0]
         except edgedb.errors.ConstraintViolationError:
             return None
-        return created_user
+        return make_pydantic_model(User, created_user)
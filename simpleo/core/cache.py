@@ -0,0 +1,102 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+In-process caches
+"""
+
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, TypeVar
+
+KEY_TYPE = TypeVar("KEY_TYPE", bound=Hashable)
+VALUE_TYPE = TypeVar("VALUE_TYPE")
+
+
+class TTLCache(Generic[KEY_TYPE, VALUE_TYPE]):
+    """
+    Bounded LRU cache with per-entry expiration.
+
+    Entries live until their own expiration time or max_age, whichever comes first.
+    """
+
+    __slots__ = ("maxsize", "max_age", "hits", "misses", "_data")
+
+    def __init__(self, maxsize: int, max_age: float) -> None:
+        """
+        :param maxsize: maximum amount of entries
+        :param max_age: maximum entry lifetime in seconds
+        """
+        self.maxsize = maxsize
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[KEY_TYPE, tuple[float, VALUE_TYPE]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: KEY_TYPE) -> VALUE_TYPE | None:
+        """
+        Get value if it exists and not expired
+        :param key:
+        :return:
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: KEY_TYPE, value: VALUE_TYPE, ttl: float | None = None) -> None:
+        """
+        Put value to cache
+        :param key:
+        :param value:
+        :param ttl: entry lifetime in seconds, capped by max_age
+        :return:
+        """
+        if self.maxsize <= 0:
+            return
+        ttl = self.max_age if ttl is None else min(ttl, self.max_age)
+        if ttl <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: KEY_TYPE) -> None:
+        """
+        Delete value from cache
+        :param key:
+        :return:
+        """
+        self._data.pop(key, None)
+
+    def delete_where(self, predicate: Callable[[KEY_TYPE, VALUE_TYPE], bool]) -> int:
+        """
+        Delete all values matched by predicate
+        :param predicate:
+        :return: amount of deleted values
+        """
+        keys = [key for key, (_, value) in self._data.items() if predicate(key, value)]
+        for key in keys:
+            del self._data[key]
+        return len(keys)
+
+    def clear(self) -> None:
+        """
+        Delete all values
+        :return:
+        """
+        self._data.clear()
@@ -0,0 +1,98 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+Conditional GET helpers: ETag, Last-Modified and 304 responses
+"""
+
+import datetime
+import email.utils
+import hashlib
+from typing import Any
+
+from fastapi import Request, Response, status
+
+
+def make_etag(*parts: Any) -> str:
+    """
+    Make strong ETag from version parts
+    :param parts:
+    :return:
+    """
+    return f'"{hashlib.sha1("|".join(map(str, parts)).encode("utf-8")).hexdigest()}"'
+
+
+def body_etag(body: bytes) -> str:
+    """
+    Make strong ETag from response body
+    :param body:
+    :return:
+    """
+    return f'"{hashlib.sha1(body).hexdigest()}"'
+
+
+def has_conditions(request: Request) -> bool:
+    """
+    Check if request is conditional
+    :param request:
+    :return:
+    """
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+
+def is_not_modified(request: Request,
+                    etag: str | None,
+                    last_modified: datetime.datetime | None) -> bool:
+    """
+    Check request conditions. If-None-Match takes precedence over If-Modified-Since.
+    :param request:
+    :param etag:
+    :param last_modified:
+    :return:
+    """
+    if (if_none_match := request.headers.get("if-none-match")) is not None:
+        if etag is None:
+            return False
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        return "*" in tags or etag in tags
+
+    if (if_modified_since := request.headers.get("if-modified-since")) is not None and last_modified:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=datetime.timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def set_validators(response: Response,
+                   etag: str | None,
+                   last_modified: datetime.datetime | None) -> Response:
+    """
+    Put ETag and Last-Modified headers to response
+    :param response:
+    :param etag:
+    :param last_modified:
+    :return:
+    """
+    if etag:
+        response.headers["ETag"] = etag
+    if last_modified:
+        response.headers["Last-Modified"] = email.utils.format_datetime(
+            last_modified.astimezone(datetime.timezone.utc), usegmt=True
+        )
+    return response
+
+
+def not_modified(etag: str | None, last_modified: datetime.datetime | None) -> Response:
+    """
+    Make 304 response
+    :param etag:
+    :param last_modified:
+    :return:
+    """
+    return set_validators(Response(status_code=status.HTTP_304_NOT_MODIFIED), etag, last_modified)
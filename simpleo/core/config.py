@@ -9,13 +9,26 @@
 """
 Project configuration
 """
-from typing import List, Optional, Union
+from functools import cached_property
+from typing import TYPE_CHECKING, List, Literal, Optional, Union
 
-import pyseto
 # pylint: disable=no-name-in-module
 from pydantic import AnyHttpUrl, HttpUrl, field_validator, FieldValidationInfo
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from pyseto import KeyInterface
+
+if TYPE_CHECKING:
+    from pyseto import KeyInterface
+
+
+def _paseto_key(key: str) -> "KeyInterface":
+    """
+    Create PASETO v4 public key object from PEM
+    :param key:
+    :return:
+    """
+    import pyseto  # pylint: disable=import-outside-toplevel
+
+    return pyseto.Key.new(version=4, purpose="public", key=key)
 
 
 class Settings(BaseSettings):
@@ -29,59 +42,95 @@ class Settings(BaseSettings):
     SECRET_REFRESH_KEY: str
     PUBLIC_REFRESH_KEY: str
 
-    PRIVATE_SECRET_ACCESS_KEY: KeyInterface | None = None
-    PRIVATE_PUBLIC_ACCESS_KEY: KeyInterface | None = None
-    PRIVATE_SECRET_REFRESH_KEY: KeyInterface | None = None
-    PRIVATE_PUBLIC_REFRESH_KEY: KeyInterface | None = None
-
-    @field_validator("PRIVATE_SECRET_ACCESS_KEY", mode="before")  # noqa
-    @classmethod
-    def create_private_access_key(cls, _, values: FieldValidationInfo) -> KeyInterface:
+    @cached_property
+    def PRIVATE_SECRET_ACCESS_KEY(self) -> "KeyInterface":
         """
-        Create private key for access keys
-        :param _:
-        :param values:
+        Private key for access keys, created on first use
         :return:
         """
-        return pyseto.Key.new(version=4, purpose="public", key=values.data.get("SECRET_ACCESS_KEY"))
+        return _paseto_key(self.SECRET_ACCESS_KEY)
 
-    @field_validator("PRIVATE_PUBLIC_ACCESS_KEY", mode="before")  # noqa
-    @classmethod
-    def create_public_access_key(cls, _, values: FieldValidationInfo) -> KeyInterface:
+    @cached_property
+    def PRIVATE_PUBLIC_ACCESS_KEY(self) -> "KeyInterface":
         """
-        Create public key for access keys
-        :param _:
-        :param values:
+        Public key for access keys, created on first use
         :return:
         """
-        return pyseto.Key.new(version=4, purpose="public", key=values.data.get("PUBLIC_ACCESS_KEY"))
+        return _paseto_key(self.PUBLIC_ACCESS_KEY)
 
-    @field_validator("PRIVATE_SECRET_REFRESH_KEY", mode="before")  # noqa
-    @classmethod
-    def create_private_refresh_key(cls, _, values: FieldValidationInfo) -> KeyInterface:
+    @cached_property
+    def PRIVATE_SECRET_REFRESH_KEY(self) -> "KeyInterface":
         """
-        Create private key for refresh keys
-        :param _:
-        :param values:
+        Private key for refresh keys, created on first use
         :return:
         """
-        return pyseto.Key.new(version=4, purpose="public", key=values.data.get("SECRET_REFRESH_KEY"))
+        return _paseto_key(self.SECRET_REFRESH_KEY)
 
-    @field_validator("PRIVATE_PUBLIC_REFRESH_KEY", mode="before")  # noqa
-    @classmethod
-    def create_public_refresh_key(cls, _, values: FieldValidationInfo) -> KeyInterface:
+    @cached_property
+    def PRIVATE_PUBLIC_REFRESH_KEY(self) -> "KeyInterface":
         """
-        Create public key for refresh keys
-        :param _:
-        :param values:
+        Public key for refresh keys, created on first use
         :return:
         """
-        return pyseto.Key.new(version=4, purpose="public", key=values.data.get("PUBLIC_REFRESH_KEY"))
+        return _paseto_key(self.PUBLIC_REFRESH_KEY)
 
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
     REFRESH_TOKEN_EXPIRE_MINUTES: int = 60 * 24
+
+    ACCESS_TOKEN_CACHE_SIZE: int = 10000
+    ACCESS_TOKEN_CACHE_MAX_AGE: float = 60.0
+
+    USER_CACHE_TTL: int = 60 * 10
+    USER_CACHE_L1_SIZE: int = 10000
+    USER_CACHE_L1_MAX_AGE: float = 30.0
+
+    NEWS_PAGE_SIZE_DEFAULT: int = 20
+    NEWS_PAGE_SIZE_MAX: int = 100
+    NEWS_EXPORT_CHUNK_SIZE: int = 500
+    NEWS_BULK_MAX_SIZE: int = 500
+
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_DEFAULT_TTL: int = 30
+    RESPONSE_CACHE_STALE_TTL: int = 30
+    RESPONSE_CACHE_TTL: dict[str, int] = {"news-list": 15, "news-detail": 60}
+
+    PASSWORD_HASHING_WORKERS: int = 4
+    PASSWORD_HASHING_MAX_CONCURRENCY: int = 4
+    PASSWORD_HASHING_QUEUE_TIMEOUT: float = 5.0
+    PASSWORD_HASHING_USE_PROCESSES: bool = False
+
+    # benchmarks.loadtest turns limits off for its in-process app unless run with --rate-limit
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_LOCAL_SIZE: int = 100000
+    RATE_LIMIT_LOGIN_IP: str = "30/minute"
+    RATE_LIMIT_LOGIN_USERNAME: str = "5/minute"
+    RATE_LIMIT_REGISTER_IP: str = "5/minute"
+
+    TASK_QUEUE_WORKERS: int = 2
+    TASK_QUEUE_CAPACITY: int = 10000
+    TASK_QUEUE_MAX_ATTEMPTS: int = 5
+    TASK_QUEUE_RETRY_BACKOFF: float = 0.5
+    TASK_QUEUE_DRAIN_TIMEOUT: float = 10.0
+    TASK_QUEUE_DURABLE: bool = False
+    TASK_QUEUE_HEARTBEAT_TTL: int = 30
+    TASK_QUEUE_REDIS_DOWN_TIMEOUT: float = 5.0
+
+    SINGLE_FLIGHT_ENABLED: bool = True
+    SINGLE_FLIGHT_TIMEOUT: float = 10.0
+
     SERVER_NAME: str
     SERVER_HOST: AnyHttpUrl
+    SERVER_BIND_HOST: str = "0.0.0.0"
+    SERVER_BIND_PORT: int = 8000
+    SERVER_WORKERS: int = 0
+    SERVER_KEEP_ALIVE: int = 5
+    SERVER_BACKLOG: int = 2048
+    SERVER_MAX_REQUESTS: int = 0
+    SERVER_GRACEFUL_SHUTDOWN_TIMEOUT: int = 30
+    SERVER_FORWARDED_ALLOW_IPS: str = "127.0.0.1"
+    SERVER_TIMING_ENABLED: bool = True
+    METRICS_ALLOW_IPS: str = "127.0.0.1,::1"
+    METRICS_TOKEN: str | None = None
     TIMEZONE: str = "Europe/Moscow"
     BACKEND_CORS_ORIGINS: List[AnyHttpUrl] = ["http://localhost:3000", "https://2cac-193-41-142-236.ngrok-free.app"]
 
@@ -107,6 +156,15 @@ class Settings(BaseSettings):
     DB_PORT: int = 5656
     DB_HTTP_URI: str | None = None
     DB_TLS_FILE_PATH: str
+    DB_POOL_CONCURRENCY: int = 20
+    DB_CONNECT_TIMEOUT: float = 10.0
+    DB_WAIT_UNTIL_AVAILABLE: float = 30.0
+    DB_RETRY_ATTEMPTS: int = 3
+    DB_BOUND_CLIENTS_CACHE_SIZE: int = 1024
+    SLOW_QUERY_THRESHOLD_MS: float = 200.0
+    QUERY_BUDGET: int = 10
+    QUERY_BUDGET_MODE: Literal["off", "warn", "strict"] = "warn"
+    N_PLUS_ONE_THRESHOLD: int = 5
 
     @field_validator("DB_HTTP_URI", mode="before")  # noqa
     @classmethod
@@ -128,6 +186,11 @@ class Settings(BaseSettings):
     REDIS_PORT: int
     REDIS_DB: int
     REDIS_HTTP_URI: str | None = None
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: float = 5.0
+    REDIS_SOCKET_TIMEOUT: float = 5.0
+    REDIS_SOCKET_CONNECT_TIMEOUT: float = 5.0
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30
 
     @field_validator("REDIS_HTTP_URI", mode="before")  # noqa
     @classmethod
@@ -7,8 +7,217 @@
 EdgeDB connection
 """
 
-from edgedb import create_async_client, AsyncIOClient
+import asyncio
+import contextlib
+import functools
+import os
+import time
+import uuid
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncIterator, Callable
+
+from edgedb import create_async_client, AsyncIOClient, RetryOptions
 
 from simpleo.core.config import settings
+from simpleo.core.metrics import Gauge, registry, timed
+from simpleo.core.queries import record_query
+
+
+@dataclass
+class PoolStats:
+    """
+    Connection pool occupancy and wait time
+    """
+    max_concurrency: int
+    in_use: int = 0
+    waiting: int = 0
+    acquired: int = 0
+    wait_seconds_total: float = 0.0
+    wait_seconds_max: float = 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        """
+        Stats with average wait time
+        :return:
+        """
+        return {
+            **asdict(self),
+            "wait_seconds_average": self.wait_seconds_total / self.acquired if self.acquired else 0.0,
+        }
+
+
+pool_stats = PoolStats(max_concurrency=settings.DB_POOL_CONCURRENCY)
+_pool_gate = asyncio.Semaphore(settings.DB_POOL_CONCURRENCY)
+
+
+@contextlib.asynccontextmanager
+async def _acquire() -> AsyncIterator[None]:
+    """
+    Take pool slot measuring wait time.
+    Gate has pool size, so waiting happens here instead of inside the pool.
+    """
+    pool_stats.waiting += 1
+    started_at = time.perf_counter()
+    try:
+        await _pool_gate.acquire()
+    finally:
+        pool_stats.waiting -= 1
+    waited = time.perf_counter() - started_at
+    pool_stats.acquired += 1
+    pool_stats.wait_seconds_total += waited
+    pool_stats.wait_seconds_max = max(pool_stats.wait_seconds_max, waited)
+    pool_stats.in_use += 1
+    try:
+        yield
+    finally:
+        pool_stats.in_use -= 1
+        _pool_gate.release()
+
+
+def _create_client() -> AsyncIOClient:
+    """
+    Create EdgeDB client with configured pool
+    :return:
+    """
+    return create_async_client(
+        settings.DB_HTTP_URI,
+        tls_ca_file=settings.DB_TLS_FILE_PATH,
+        max_concurrency=settings.DB_POOL_CONCURRENCY,
+        timeout=settings.DB_CONNECT_TIMEOUT,
+        wait_until_available=settings.DB_WAIT_UNTIL_AVAILABLE,
+    ).with_retry_options(RetryOptions(attempts=settings.DB_RETRY_ATTEMPTS))
+
+
+class DatabaseClient:
+    """
+    EdgeDB client wrapper accounting pool usage of queries and recording them in request query log.
+    Transactions are passed to the pool as is.
+    The underlying client is created on first use, so nothing is shared between forked workers.
+    """
+
+    __slots__ = ("_client", "_factory")
+
+    def __init__(self, factory: Callable[[], AsyncIOClient]) -> None:
+        """
+        :param factory: Creates underlying client on first use
+        """
+        self._client: AsyncIOClient | None = None
+        self._factory = factory
+
+    @property
+    def client(self) -> AsyncIOClient:
+        """
+        Underlying client
+        :return:
+        """
+        if self._client is None:
+            self._client = self._factory()
+        return self._client
+
+    @property
+    def is_initialized(self) -> bool:
+        """
+        Whether underlying client is created
+        :return:
+        """
+        return self._client is not None
+
+    def reset(self) -> None:
+        """
+        Forget underlying client without closing it, used in forked child
+        :return:
+        """
+        self._client = None
+
+    def with_globals(self, *args: Any, **globals_: Any) -> "DatabaseClient":
+        """
+        Same client with bound globals
+        """
+        return DatabaseClient(lambda: self.client.with_globals(*args, **globals_))
+
+    async def _run(self, method: str, query: str, args: tuple, kwargs: dict) -> Any:
+        """
+        Run query taking pool slot, record it in request query log
+        """
+        async with _acquire():
+            with timed("db"):
+                started_at = time.perf_counter()
+                result = await getattr(self.client, method)(query, *args, **kwargs)
+                duration = time.perf_counter() - started_at
+        if method == "query":
+            rows = len(result)
+        else:
+            rows = None if method == "query_json" else int(result is not None)
+        record_query(query, duration, rows)
+        return result
+
+    async def query(self, query: str, *args: Any, **kwargs: Any) -> Any:
+        return await self._run("query", query, args, kwargs)
+
+    async def query_single(self, query: str, *args: Any, **kwargs: Any) -> Any:
+        return await self._run("query_single", query, args, kwargs)
+
+    async def query_required_single(self, query: str, *args: Any, **kwargs: Any) -> Any:
+        return await self._run("query_required_single", query, args, kwargs)
+
+    async def query_json(self, query: str, *args: Any, **kwargs: Any) -> str:
+        return await self._run("query_json", query, args, kwargs)
+
+    async def execute(self, query: str, *args: Any, **kwargs: Any) -> None:
+        return await self._run("execute", query, args, kwargs)
+
+    def transaction(self) -> Any:
+        return self.client.transaction()
+
+    async def ensure_connected(self) -> "DatabaseClient":
+        await self.client.ensure_connected()
+        return self
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+
+
+client: DatabaseClient = DatabaseClient(_create_client)
+
+
+@functools.lru_cache(maxsize=settings.DB_BOUND_CLIENTS_CACHE_SIZE)
+def client_for_user(user_id: uuid.UUID) -> DatabaseClient:
+    """
+    Client with bound auth::current_user_id, reused between requests of the user
+    :param user_id:
+    :return:
+    """
+    return client.with_globals({"auth::current_user_id": user_id})
+
+
+def _reset_after_fork() -> None:
+    """
+    Drop connections and pool state inherited from parent process
+    :return:
+    """
+    global _pool_gate  # pylint: disable=global-statement
+    client.reset()
+    client_for_user.cache_clear()
+    _pool_gate = asyncio.Semaphore(settings.DB_POOL_CONCURRENCY)
+    pool_stats.in_use = pool_stats.waiting = 0
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
 
-client: AsyncIOClient = create_async_client(settings.DB_HTTP_URI, tls_ca_file=settings.DB_TLS_FILE_PATH)
+registry.register(Gauge(
+    "simpleo_db_pool", "EdgeDB pool occupancy and waiting queries", ("stat",),
+    function=lambda: {
+        ("max_concurrency",): pool_stats.max_concurrency,
+        ("in_use",): pool_stats.in_use,
+        ("waiting",): pool_stats.waiting,
+    },
+))
+registry.register(Gauge(
+    "simpleo_db_pool_wait_seconds", "EdgeDB pool slot wait time", ("stat",),
+    function=lambda: {
+        ("total",): pool_stats.wait_seconds_total,
+        ("max",): pool_stats.wait_seconds_max,
+        ("acquired",): pool_stats.acquired,
+    },
+))
@@ -7,10 +7,161 @@
 Redis connection
 """
 
-from redis import asyncio as aioredis
-from redis.asyncio.client import Redis
+import contextlib
+import os
+from typing import Any, AsyncIterator
+
+from redis.asyncio import BlockingConnectionPool
+from redis.asyncio.client import Pipeline, Redis
 
 from simpleo.core.config import settings
+from simpleo.core.metrics import timed
+
+
+class InstrumentedRedis(Redis):
+    """
+    Redis client recording command time
+    """
+
+    async def execute_command(self, *args: Any, **options: Any) -> Any:
+        with timed("redis"):
+            return await super().execute_command(*args, **options)
+
+
+class RedisManager:
+    """
+    Owner of the Redis connection pool.
+    Pool and client are created on first use, connect() checks the server on startup
+    and close() releases every connection on shutdown.
+    """
+
+    def __init__(self, url: str) -> None:
+        """
+        :param url: Redis connection string
+        """
+        self.url = url
+        self._pool: BlockingConnectionPool | None = None
+        self._client: Redis | None = None
+
+    @property
+    def pool(self) -> BlockingConnectionPool:
+        """
+        Connection pool
+        :return:
+        """
+        if self._pool is None:
+            self._pool = self._create_pool()
+        return self._pool
+
+    @property
+    def client(self) -> Redis:
+        """
+        Client on the pool
+        :return:
+        """
+        if self._client is None:
+            self._client = InstrumentedRedis(connection_pool=self.pool)
+        return self._client
+
+    @property
+    def is_initialized(self) -> bool:
+        """
+        Whether pool is created
+        :return:
+        """
+        return self._pool is not None
+
+    def reset(self) -> None:
+        """
+        Forget pool and client without closing them, used in forked child
+        :return:
+        """
+        self._pool = None
+        self._client = None
+
+    def _create_pool(self) -> BlockingConnectionPool:
+        return BlockingConnectionPool.from_url(
+            self.url,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+            socket_keepalive=True,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+            retry_on_timeout=True,
+        )
+
+    def create_subscriber(self) -> Redis:
+        """
+        Client with own connection for pub/sub. It has no socket timeout, an idle
+        subscription is kept alive by health checks sent while waiting for messages.
+        Caller closes it.
+        :return:
+        """
+        return Redis.from_url(
+            self.url,
+            socket_timeout=None,
+            socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+            socket_keepalive=True,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+        )
+
+    async def connect(self) -> None:
+        """
+        Check Redis is reachable
+        :return:
+        """
+        await self.client.ping()
+
+    async def close(self) -> None:
+        """
+        Close client and all pool connections
+        :return:
+        """
+        if self._client is not None:
+            await self._client.aclose()
+        if self._pool is not None:
+            await self._pool.disconnect()
+
+    @contextlib.asynccontextmanager
+    async def batch(self, transaction: bool = False) -> AsyncIterator[Pipeline]:
+        """
+        Queue commands and send them in one round trip on exit.
+        Nothing is sent if the block raises.
+        :param transaction: Wrap commands in MULTI/EXEC
+        :return: Pipeline to queue commands on
+        """
+        async with self.client.pipeline(transaction=transaction) as pipe:
+            yield pipe
+            with timed("redis"):
+                await pipe.execute()
+
+    async def execute_batch(self, *commands: tuple[str, Any]) -> list[Any]:
+        """
+        Run commands in one round trip and return their results
+        :param commands: Tuples of command name and arguments, e.g. ("GET", "key")
+        :return:
+        """
+        async with self.client.pipeline(transaction=False) as pipe:
+            for command in commands:
+                pipe.execute_command(*command)
+            with timed("redis"):
+                return await pipe.execute()
+
+
+class _LazyRedis:
+    """
+    Module level stand-in for the client, resolved on every attribute access
+    """
+
+    __slots__ = ()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(redis_manager.client, name)
+
 
-redis: Redis = aioredis.from_url(settings.REDIS_HTTP_URI)
+redis_manager = RedisManager(settings.REDIS_HTTP_URI)
+redis: Redis = _LazyRedis()  # type: ignore[assignment]
+batch = redis_manager.batch
 
+os.register_at_fork(after_in_child=redis_manager.reset)
@@ -7,28 +7,73 @@
 Base for Table Data Gateways
 """
 
+import asyncio
+import logging
 import uuid
+from typing import Any, ClassVar
 
-from edgedb import AsyncIOClient
+from simpleo.core.config import settings
+from simpleo.core.connections.edgedb import DatabaseClient, client as database_client, client_for_user
+from simpleo.core.queries import fingerprint
+from simpleo.core.singleflight import single_flight
 
-from simpleo.core.connections.edgedb import client as database_client
+logger = logging.getLogger(__name__)
+
+
+class QueryTimeout(RuntimeError):
+    """
+    Coalesced query didn't finish in time, the app returns 503 for it
+    """
 
 
 class BaseTableDataGateway:
     """
     Base class for table data gateways.
+
+    Every subclass is registered for query warm-up. List read methods to warm
+    up with sample arguments in warmup_calls, they are called at startup
+    inside a transaction that is always rolled back. Write methods are not
+    listed, their cache and task side effects are not rolled back.
+
+    Hot reads may use coalesced_query, identical concurrent queries then
+    share one round trip.
     """
 
-    __slots__ = "database"
+    __slots__ = ("database", "user_id")
+
+    registry: ClassVar[list[type["BaseTableDataGateway"]]] = []
+    warmup_calls: ClassVar[tuple[tuple[str, dict[str, Any]], ...]] = ()
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        BaseTableDataGateway.registry.append(cls)
 
     def __init__(self, user_id: uuid.UUID | None = None) -> None:
         """
         Set-up globals if it provided
         :param user_id:
         """
+        self.user_id = user_id
         if user_id:
-            self.database: AsyncIOClient = database_client.with_globals({
-                "auth::current_user_id": user_id
-            })
+            self.database: DatabaseClient = client_for_user(user_id)
         else:
-            self.database: AsyncIOClient = database_client
+            self.database: DatabaseClient = database_client
+
+    async def coalesced_query(self, query: str, **kwargs: Any) -> list[Any]:
+        """
+        Run query sharing one round trip between identical concurrent calls.
+        Calls are equal if they have the same query, arguments and database client,
+        which carries globals of the user. Arguments must be hashable.
+        :param query:
+        :param kwargs:
+        :return: Query result, shared between callers, do not modify it
+        :raises QueryTimeout: Query took longer than SINGLE_FLIGHT_TIMEOUT, it's not an empty result
+        """
+        if not settings.SINGLE_FLIGHT_ENABLED:
+            return await self.database.query(query, **kwargs)
+        key = (query, tuple(sorted(kwargs.items())), self.database)
+        try:
+            return await single_flight.do(key, lambda: self.database.query(query, **kwargs))
+        except asyncio.TimeoutError as error:
+            logger.warning("Query timed out after %.1f s: %s", single_flight.timeout, fingerprint(query)[0])
+            raise QueryTimeout(f"Query timed out after {single_flight.timeout:.1f} s") from error
@@ -0,0 +1,185 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+Two-level entity cache.
+
+L1 lives in worker memory, L2 lives in Redis. Invalidations are broadcast to
+every worker through Redis pub/sub. Only serialized fields are cached, so
+fields with exclude=True (like secrets) are never written to Redis and the
+model must allow them to be missing.
+"""
+
+import asyncio
+import contextlib
+from typing import Awaitable, Callable, Generic, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+from redis.exceptions import RedisError
+
+from simpleo.core.cache import TTLCache
+from simpleo.core.config import settings
+from simpleo.core.connections.redis import batch, redis, redis_manager
+
+MODEL_TYPE = TypeVar("MODEL_TYPE", bound=BaseModel)
+
+INVALIDATION_CHANNEL = "entity-cache-invalidation"
+
+_registry: dict[str, "EntityCache"] = {}
+_listener_task: asyncio.Task | None = None
+
+
+class EntityCache(Generic[MODEL_TYPE]):
+    """
+    Cache of pydantic entities by key
+    """
+
+    def __init__(self,
+                 namespace: str,
+                 model: Type[MODEL_TYPE],
+                 ttl: int,
+                 l1_maxsize: int,
+                 l1_max_age: float) -> None:
+        """
+        :param namespace: unique cache name, used as Redis key prefix
+        :param model: pydantic model of cached entity
+        :param ttl: L2 entry lifetime in seconds
+        :param l1_maxsize: maximum amount of L1 entries
+        :param l1_max_age: L1 entry lifetime in seconds
+        """
+        self.namespace = namespace
+        self.model = model
+        self.ttl = ttl
+        self.local: TTLCache[str, MODEL_TYPE] = TTLCache(maxsize=l1_maxsize, max_age=l1_max_age)
+        self._invalidation_hooks: list[Callable[[str], None]] = []
+        _registry[namespace] = self
+
+    def _redis_key(self, key: str) -> str:
+        return f"entity-cache:{self.namespace}:{key}"
+
+    def add_invalidation_hook(self, hook: Callable[[str], None]) -> None:
+        """
+        Register function called with key on every invalidation, local or remote
+        :param hook:
+        :return:
+        """
+        self._invalidation_hooks.append(hook)
+
+    async def get(self, key: str) -> MODEL_TYPE | None:
+        """
+        Get entity from L1, then from L2
+        :param key:
+        :return:
+        """
+        if (value := self.local.get(key)) is not None:
+            return value
+        try:
+            raw = await redis.get(self._redis_key(key))
+        except RedisError:
+            return None
+        if raw is None:
+            return None
+        try:
+            value = self.model.model_validate_json(raw)
+        except ValidationError:
+            return None
+        self.local.set(key, value)
+        return value
+
+    async def set(self, key: str, value: BaseModel) -> MODEL_TYPE:
+        """
+        Put serialized fields of entity to both levels
+        :param key:
+        :param value:
+        :return: Cached entity
+        """
+        raw = value.model_dump_json()
+        cached = self.model.model_validate_json(raw)
+        self.local.set(key, cached)
+        with contextlib.suppress(RedisError):
+            await redis.set(self._redis_key(key), raw, ex=self.ttl)
+        return cached
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[BaseModel | None]]) -> MODEL_TYPE | None:
+        """
+        Get entity from cache or load it and put to cache
+        :param key:
+        :param loader:
+        :return: Cached entity, same whether it was loaded or not
+        """
+        if (value := await self.get(key)) is not None:
+            return value
+        if (value := await loader()) is not None:
+            return await self.set(key, value)
+        return None
+
+    def _drop_local(self, key: str) -> None:
+        self.local.delete(key)
+        for hook in self._invalidation_hooks:
+            hook(key)
+
+    async def invalidate(self, key: str) -> None:
+        """
+        Drop entity from both levels on every worker
+        :param key:
+        :return:
+        """
+        self._drop_local(key)
+        with contextlib.suppress(RedisError):
+            async with batch() as pipe:
+                pipe.delete(self._redis_key(key))
+                pipe.publish(INVALIDATION_CHANNEL, f"{self.namespace}:{key}")
+
+
+async def _listen_invalidations() -> None:
+    """
+    Apply invalidations published by other workers.
+    L1 is dropped completely after reconnect, messages may be lost meanwhile.
+    """
+    while True:
+        subscriber = redis_manager.create_subscriber()
+        try:
+            async with subscriber.pubsub(ignore_subscribe_messages=True) as pubsub:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                for cache in _registry.values():
+                    cache.local.clear()
+                while True:
+                    # Waiting is bounded, so health checks are sent on idle channel
+                    if (message := await pubsub.get_message(
+                            ignore_subscribe_messages=True,
+                            timeout=max(settings.REDIS_HEALTH_CHECK_INTERVAL, 1),
+                    )) is None:
+                        continue
+                    namespace, _, key = message["data"].decode("utf-8").partition(":")
+                    if cache := _registry.get(namespace):
+                        cache._drop_local(key)  # pylint: disable=protected-access
+        except RedisError:
+            await asyncio.sleep(1)
+        finally:
+            with contextlib.suppress(RedisError):
+                await subscriber.aclose()
+
+
+def start_invalidation_listener() -> None:
+    """
+    Start listening invalidations from other workers
+    :return:
+    """
+    global _listener_task  # pylint: disable=global-statement
+    if _listener_task is None:
+        _listener_task = asyncio.create_task(_listen_invalidations())
+
+
+async def stop_invalidation_listener() -> None:
+    """
+    Stop listening invalidations
+    :return:
+    """
+    global _listener_task  # pylint: disable=global-statement
+    if _listener_task is not None:
+        _listener_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _listener_task
+        _listener_task = None
@@ -0,0 +1,73 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+Health endpoints for load balancer.
+
+/pool and /metrics are internal: they are served to clients from
+METRICS_ALLOW_IPS or with METRICS_TOKEN as bearer token. Their values are
+per worker process and every request is served by one of the workers, so
+samples are labelled with pid and should be aggregated over it.
+"""
+
+import hmac
+import os
+
+from fastapi import Depends, HTTPException, Request, Response, status
+from fastapi.responses import PlainTextResponse
+from fastapi.routing import APIRouter
+
+from simpleo.core.config import settings
+from simpleo.core.connections.edgedb import pool_stats
+from simpleo.core.metrics import registry
+from simpleo.core.warmup import is_ready
+
+router = APIRouter()
+
+
+def internal_access(request: Request) -> None:
+    """
+    Allow only monitoring clients
+    :param request:
+    :return:
+    """
+    allowed_ips = {ip.strip() for ip in settings.METRICS_ALLOW_IPS.split(",") if ip.strip()}
+    if request.client and request.client.host in allowed_ips:
+        return
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if settings.METRICS_TOKEN and scheme.lower() == "bearer" and \
+            hmac.compare_digest(token.encode("utf-8"), settings.METRICS_TOKEN.encode("utf-8")):
+        return
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Forbidden."
+    )
+
+
+@router.get("/ready", response_model=dict)
+async def ready(response: Response) -> dict:
+    """
+    Readiness probe: 200 after warm-up, 503 before
+    """
+    if is_ready():
+        return {"status": "ready"}
+    response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"status": "warming up"}
+
+
+@router.get("/pool", response_model=dict, dependencies=[Depends(internal_access)])
+async def pool() -> dict:
+    """
+    EdgeDB pool occupancy and wait time of this worker
+    """
+    return {"pid": os.getpid(), **pool_stats.as_dict()}
+
+
+@router.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(internal_access)])
+async def metrics() -> PlainTextResponse:
+    """
+    Prometheus metrics of this worker
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,109 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+Import-time budget check.
+
+Imports the app in a fresh interpreter with ``-X importtime`` and fails if
+project modules spend more than the budget on import, or if importing opened
+database/Redis clients or built PASETO keys. Third-party import time is
+reported but not budgeted, it does not depend on this code.
+
+Usage: python -m simpleo.core.importtime [--budget MS] [--top N]
+
+The budget is enforced by tests/test_importtime.py.
+"""
+
+import argparse
+import subprocess
+import sys
+from dataclasses import dataclass
+
+# Self time of all simpleo modules, milliseconds
+IMPORT_TIME_BUDGET_MS = 250
+
+_PROBE = """
+import simpleo.app
+from simpleo.core.config import settings
+from simpleo.core.connections.edgedb import client
+from simpleo.core.connections.redis import redis_manager
+eager = [name for name, value in (
+    ("edgedb client", client.is_initialized),
+    ("redis pool", redis_manager.is_initialized),
+    ("paseto keys", any(name.startswith("PRIVATE_") for name in vars(settings))),
+) if value]
+print(",".join(eager))
+"""
+
+
+@dataclass
+class ModuleImportTime:
+    """
+    Import time of one module, microseconds
+    """
+    name: str
+    self_us: int
+    cumulative_us: int
+
+
+def measure() -> tuple[list[ModuleImportTime], list[str]]:
+    """
+    Import app in subprocess
+    :return: Import times and names of resources created on import
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE],
+        capture_output=True, text=True, check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        modules.append(ModuleImportTime(name.strip(), int(self_us), int(cumulative_us)))
+    return modules, [name for name in result.stdout.strip().split(",") if name]
+
+
+def own_modules(modules: list[ModuleImportTime]) -> list[ModuleImportTime]:
+    """
+    Project modules, slowest first
+    :param modules:
+    :return:
+    """
+    return sorted((module for module in modules if module.name.split(".")[0] == "simpleo"),
+                  key=lambda module: module.self_us, reverse=True)
+
+
+def main() -> int:
+    """
+    Check import-time budget
+    :return: Exit code
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=float, default=IMPORT_TIME_BUDGET_MS, help="Budget of own modules, ms")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest own modules to show")
+    args = parser.parse_args()
+
+    modules, eager = measure()
+    own = own_modules(modules)
+    own_ms = sum(module.self_us for module in own) / 1000
+    total_ms = next((module.cumulative_us for module in modules if module.name == "simpleo.app"), 0) / 1000
+
+    print(f"simpleo.app total: {total_ms:.1f} ms, own modules: {own_ms:.1f} ms (budget {args.budget:.0f} ms)")
+    for module in own[:args.top]:
+        print(f"  {module.self_us / 1000:8.1f} ms  {module.name}")
+
+    failed = False
+    if own_ms > args.budget:
+        print("FAIL: import-time budget exceeded")
+        failed = True
+    if eager:
+        print(f"FAIL: created on import: {', '.join(eager)}")
+        failed = True
+    return int(failed)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
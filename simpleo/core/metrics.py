@@ -0,0 +1,340 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+Prometheus metrics and per-request timing breakdown.
+
+Metrics are kept per worker process and rendered in Prometheus text format,
+every sample is labelled with pid of the worker. A scrape reaches one of the
+workers, so aggregate over pid (e.g. sum without (pid)).
+Time spent in dependencies (EdgeDB, Redis, PASETO, bcrypt) is recorded with
+timed() into a histogram and into the current request's breakdown, which
+MetricsMiddleware returns as Server-Timing header.
+"""
+
+import contextlib
+import math
+import os
+import time
+from contextvars import ContextVar
+from typing import Callable, Iterator, TypeVar
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from simpleo.core.config import settings
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = tuple[str, ...]
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    # Read on every render, workers may be forked after import
+    pairs.append(f'pid="{os.getpid()}"')
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Metric:
+    """
+    Base of metric families
+    """
+    type: str = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        """
+        :param name: Metric name
+        :param documentation: HELP text
+        :param labelnames: Names of labels
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def _label_values(self, labels: dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        """
+        Sample lines of exposition format
+        """
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """
+        Metric family in exposition format
+        :return:
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}", *self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing value
+    """
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """
+        Increase value
+        :param amount:
+        :param labels:
+        :return:
+        """
+        key = self._label_values(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(Metric):
+    """
+    Value that goes up and down.
+    With function the value is read on every scrape.
+    """
+    type = "gauge"
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 labelnames: tuple[str, ...] = (),
+                 function: Callable[[], float | dict[LabelValues, float]] | None = None) -> None:
+        """
+        :param function: Returns value, or values by label values when metric has labels
+        """
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+        self._function = function
+
+    def set(self, value: float, **labels: str) -> None:
+        """
+        Set value
+        :param value:
+        :param labels:
+        :return:
+        """
+        self._values[self._label_values(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """
+        Increase value
+        :param amount:
+        :param labels:
+        :return:
+        """
+        key = self._label_values(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        """
+        Decrease value
+        :param amount:
+        :param labels:
+        :return:
+        """
+        self.inc(-amount, **labels)
+
+    def samples(self) -> Iterator[str]:
+        values = self._values
+        if self._function is not None:
+            result = self._function()
+            values = result if isinstance(result, dict) else {(): result}
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values in cumulative buckets
+    """
+    type = "histogram"
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: dict[LabelValues, list[int]] = {}
+        self._sums: dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """
+        Observe value
+        :param value:
+        :param labels:
+        :return:
+        """
+        key = self._label_values(labels)
+        if (counts := self._counts.get(key)) is None:
+            counts = self._counts[key] = [0] * len(self.buckets)
+            self._sums[key] = 0.0
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        self._sums[key] += value
+
+    def samples(self) -> Iterator[str]:
+        for key, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(self._sums[key])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+METRIC_TYPE = TypeVar("METRIC_TYPE", bound=Metric)
+
+
+class Registry:
+    """
+    Set of metrics rendered together
+    """
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: METRIC_TYPE) -> METRIC_TYPE:
+        """
+        Add metric
+        :param metric:
+        :return: Same metric
+        """
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """
+        All metrics in exposition format
+        :return:
+        """
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "simpleo_http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status"),
+))
+http_requests_in_flight = registry.register(Gauge(
+    "simpleo_http_requests_in_flight", "HTTP requests being processed",
+))
+dependency_duration = registry.register(Histogram(
+    "simpleo_dependency_duration_seconds", "Time spent in EdgeDB, Redis, PASETO and bcrypt", ("component",),
+))
+
+_request_timings: ContextVar[dict[str, list[float]] | None] = ContextVar("request_timings", default=None)
+
+
+def observe(component: str, seconds: float) -> None:
+    """
+    Record time spent in component
+    :param component: db, redis, paseto_sign, paseto_verify, bcrypt
+    :param seconds:
+    :return:
+    """
+    dependency_duration.observe(seconds, component=component)
+    if (timings := _request_timings.get()) is not None:
+        total = timings.setdefault(component, [0.0, 0])
+        total[0] += seconds
+        total[1] += 1
+
+
+@contextlib.contextmanager
+def timed(component: str) -> Iterator[None]:
+    """
+    Record time spent in block, usable around awaits
+    :param component:
+    :return:
+    """
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(component, time.perf_counter() - started_at)
+
+
+def server_timing(timings: dict[str, list[float]], total: float) -> str:
+    """
+    Server-Timing header value
+    :param timings: Seconds and calls by component
+    :param total: Seconds since request start
+    :return:
+    """
+    entries = [f'{component};dur={seconds * 1000:.2f};desc="calls: {calls}"'
+               for component, (seconds, calls) in timings.items()]
+    entries.append(f"app;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+class MetricsMiddleware:
+    """
+    Records request latency and in-flight requests, adds Server-Timing header
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: dict[str, list[float]] = {}
+        token = _request_timings.set(timings)
+        started_at = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if settings.SERVER_TIMING_ENABLED:
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing", server_timing(timings, time.perf_counter() - started_at)
+                    )
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            http_requests_in_flight.dec()
+            _request_timings.reset(token)
+            # Route template keeps label cardinality bounded
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - started_at,
+                method=scope["method"],
+                route=getattr(route, "path_format", "unmatched"),
+                status=str(status_code),
+            )
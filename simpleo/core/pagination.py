@@ -0,0 +1,83 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+Keyset pagination helpers
+"""
+
+import base64
+import binascii
+import datetime
+import json
+import uuid
+from typing import Any
+
+from fastapi import HTTPException, status
+
+KeysetCursor = tuple[datetime.datetime, uuid.UUID]
+ScoreCursor = tuple[float, uuid.UUID]
+
+
+def _encode(values: list[Any]) -> str:
+    raw = json.dumps(values, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode(cursor: str) -> list[Any]:
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    return json.loads(raw)
+
+
+def _invalid_cursor() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Invalid cursor.",
+    )
+
+
+def encode_cursor(created_at: datetime.datetime, object_id: uuid.UUID) -> str:
+    """
+    Make opaque cursor from (created_at, id) key
+    :param created_at:
+    :param object_id:
+    :return:
+    """
+    return _encode([created_at.isoformat(), str(object_id)])
+
+
+def decode_cursor(cursor: str) -> KeysetCursor:
+    """
+    Get (created_at, id) key from opaque cursor
+    :param cursor:
+    :return:
+    """
+    try:
+        created_at, object_id = _decode(cursor)
+        return datetime.datetime.fromisoformat(created_at), uuid.UUID(object_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise _invalid_cursor()
+
+
+def encode_score_cursor(score: float, object_id: uuid.UUID) -> str:
+    """
+    Make opaque cursor from (relevance score, id) key
+    :param score:
+    :param object_id:
+    :return:
+    """
+    return _encode([score, str(object_id)])
+
+
+def decode_score_cursor(cursor: str) -> ScoreCursor:
+    """
+    Get (relevance score, id) key from opaque cursor
+    :param cursor:
+    :return:
+    """
+    try:
+        score, object_id = _decode(cursor)
+        return float(score), uuid.UUID(object_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise _invalid_cursor()
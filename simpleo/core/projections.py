@@ -0,0 +1,90 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+Sparse fieldsets: compile requested fields to EdgeQL shape
+"""
+
+import functools
+from dataclasses import dataclass
+from typing import Any
+
+from fastapi import HTTPException, status
+
+FieldsTree = dict[str, "FieldsTree | None"]
+
+
+@dataclass(frozen=True)
+class Projection:
+    """
+    Compiled projection
+        shape: EdgeQL shape selecting requested and required fields
+        include: pydantic include rule leaving only requested fields
+    """
+    shape: str
+    include: dict[str, Any]
+
+
+def _tree(fields: frozenset[str]) -> FieldsTree:
+    tree: FieldsTree = {}
+    for field in sorted(fields):
+        node = tree
+        *parents, name = field.split(".")
+        for parent in parents:
+            if node.get(parent) is None:
+                node[parent] = {}
+            node = node[parent]
+        node.setdefault(name, None)
+    return tree
+
+
+def _merge(tree: FieldsTree, other: FieldsTree) -> FieldsTree:
+    merged = dict(tree)
+    for name, children in other.items():
+        if isinstance(merged.get(name), dict) and isinstance(children, dict):
+            merged[name] = _merge(merged[name], children)
+        else:
+            merged.setdefault(name, children)
+    return merged
+
+
+def _shape(tree: FieldsTree) -> str:
+    return "{" + ", ".join(
+        name if children is None else f"{name}: {_shape(children)}" for name, children in tree.items()
+    ) + "}"
+
+
+def _include(tree: FieldsTree) -> dict[str, Any]:
+    return {name: True if children is None else _include(children) for name, children in tree.items()}
+
+
+@functools.lru_cache(maxsize=256)
+def compile_projection(fields: frozenset[str], required: frozenset[str]) -> Projection:
+    """
+    Compile projection, result is cached
+    :param fields: requested fields, nested fields are separated by dot
+    :param required: fields always selected for internal usage
+    :return:
+    """
+    requested = _tree(fields)
+    return Projection(shape=_shape(_merge(requested, _tree(required))), include=_include(requested))
+
+
+def parse_fields(fields: str | None, allowed: dict[str, frozenset[str]]) -> frozenset[str] | None:
+    """
+    Parse comma separated `fields` query parameter.
+    :param fields:
+    :param allowed: allowed field names and fields they expand to
+    :return: None if all fields requested
+    """
+    if not fields:
+        return None
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    if unknown := names - allowed.keys():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(sorted(allowed))}.",
+        )
+    return frozenset(field for name in names for field in allowed[name])
@@ -0,0 +1,148 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+Per-request query log.
+
+DatabaseClient records every query (fingerprint, duration, rows) into the
+current request's log. Slow queries are logged, repeated fingerprints are
+reported as possible N+1, and requests above the query budget are warned
+about or fail, depending on QUERY_BUDGET_MODE.
+"""
+
+import hashlib
+import logging
+import re
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from simpleo.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """
+    Request issued more queries than allowed in strict mode
+    """
+
+
+@dataclass(frozen=True)
+class QueryRecord:
+    """
+    One executed query
+    """
+    fingerprint: str
+    duration: float
+    rows: int | None
+
+
+@dataclass
+class QueryLog:
+    """
+    Queries of one request
+    """
+    path: str
+    checked: bool = True
+    records: list[QueryRecord] = field(default_factory=list)
+    counts: dict[str, int] = field(default_factory=dict)
+    budget_reported: bool = False
+
+    @property
+    def total_duration(self) -> float:
+        """
+        Seconds spent in queries
+        :return:
+        """
+        return sum(record.duration for record in self.records)
+
+
+_query_log: ContextVar[QueryLog | None] = ContextVar("query_log", default=None)
+_fingerprints: dict[str, tuple[str, str]] = {}
+_FINGERPRINTS_CACHE_SIZE = 4096
+
+
+def fingerprint(query: str) -> tuple[str, str]:
+    """
+    Stable short id of query text and its one-line summary
+    :param query:
+    :return:
+    """
+    if (cached := _fingerprints.get(query)) is None:
+        if len(_fingerprints) >= _FINGERPRINTS_CACHE_SIZE:
+            _fingerprints.clear()
+        normalized = _WHITESPACE.sub(" ", query).strip()
+        cached = _fingerprints[query] = (hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12], normalized[:120])
+    return cached
+
+
+def current_query_log() -> QueryLog | None:
+    """
+    Query log of current request
+    :return:
+    """
+    return _query_log.get()
+
+
+def skip_query_checks() -> None:
+    """
+    Disable budget and N+1 checks for current request, for endpoints paging through many rows by design
+    :return:
+    """
+    if (log := _query_log.get()) is not None:
+        log.checked = False
+
+
+def record_query(query: str, duration: float, rows: int | None) -> None:
+    """
+    Record executed query
+    :param query: Query text
+    :param duration: Seconds
+    :param rows: Number of returned rows if known
+    :return:
+    """
+    query_id, summary = fingerprint(query)
+    if duration * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS:
+        logger.warning("Slow query %s: %.1f ms, %s rows: %s", query_id, duration * 1000, rows, summary)
+
+    if (log := _query_log.get()) is None:
+        return
+    log.records.append(QueryRecord(query_id, duration, rows))
+    log.counts[query_id] = count = log.counts.get(query_id, 0) + 1
+    if not log.checked:
+        return
+    if count == settings.N_PLUS_ONE_THRESHOLD:
+        logger.warning("Possible N+1 in %s: query %s executed %d times: %s", log.path, query_id, count, summary)
+
+    if settings.QUERY_BUDGET_MODE == "off" or len(log.records) <= settings.QUERY_BUDGET:
+        return
+    if settings.QUERY_BUDGET_MODE == "strict":
+        raise QueryBudgetExceeded(f"{log.path} exceeded query budget of {settings.QUERY_BUDGET}")
+    if not log.budget_reported:
+        log.budget_reported = True
+        logger.warning("%s exceeded query budget of %d queries", log.path, settings.QUERY_BUDGET)
+
+
+class QueryLogMiddleware:
+    """
+    Opens query log for every HTTP request
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _query_log.set(QueryLog(path=f"{scope['method']} {scope['path']}"))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _query_log.reset(token)
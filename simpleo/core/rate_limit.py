@@ -0,0 +1,209 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+Token-bucket rate limiting.
+
+Every check is one Lua call, which refills and takes a token from all
+buckets of the request (per IP, per username) atomically, so a request is
+either counted in every bucket or rejected without consuming anything.
+If Redis is unavailable, buckets of the current worker are used instead.
+"""
+
+import hashlib
+import json
+import math
+import re
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from fastapi import HTTPException, Request, status
+from redis.commands.core import AsyncScript
+from redis.exceptions import RedisError
+
+from simpleo.core.cache import TTLCache
+from simpleo.core.config import settings
+from simpleo.core.connections.redis import redis, redis_manager
+from simpleo.core.metrics import Counter, registry
+
+_TOKEN_BUCKET_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local retry_after = 0
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2 - 1])
+    local rate = tonumber(ARGV[i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local available = tonumber(state[1]) or capacity
+    local updated_at = tonumber(state[2]) or now
+    available = math.min(capacity, available + math.max(0, now - updated_at) * rate)
+    if available < 1 then
+        retry_after = math.max(retry_after, (1 - available) / rate)
+    end
+    tokens[i] = available
+end
+if retry_after > 0 then
+    return tostring(retry_after)
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 2 - 1])
+    local rate = tonumber(ARGV[i * 2])
+    redis.call('HSET', key, 'tokens', tostring(tokens[i] - 1), 'ts', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000))
+end
+return '0'
+"""
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+_LIMIT_PATTERN = re.compile(r"^\s*(\d+)\s*/\s*(second|minute|hour|day)\s*$")
+
+rate_limited = registry.register(Counter(
+    "simpleo_rate_limited_total", "Requests rejected by rate limits", ("scope",),
+))
+
+
+@dataclass(frozen=True)
+class Limit:
+    """
+    Bucket of capacity tokens refilled evenly over period seconds
+    """
+    capacity: int
+    period: float
+
+    @property
+    def rate(self) -> float:
+        """
+        Tokens per second
+        :return:
+        """
+        return self.capacity / self.period
+
+    @classmethod
+    def parse(cls, value: str) -> "Limit":
+        """
+        Parse limit like "10/minute"
+        :param value:
+        :return:
+        """
+        if not (match := _LIMIT_PATTERN.match(value)):
+            raise ValueError(f"Invalid rate limit: {value!r}, expected like '10/minute'")
+        return cls(capacity=int(match[1]), period=_PERIODS[match[2]])
+
+
+class RateLimiter:
+    """
+    Token buckets in Redis with per-worker fallback
+    """
+
+    def __init__(self, prefix: str = "rate-limit") -> None:
+        """
+        :param prefix: Redis key prefix
+        """
+        self.prefix = prefix
+        self._script: AsyncScript | None = None
+        # value is (tokens, updated_at)
+        self._local: TTLCache[str, tuple[float, float]] = TTLCache(
+            maxsize=settings.RATE_LIMIT_LOCAL_SIZE, max_age=_PERIODS["day"],
+        )
+
+    async def _hit_redis(self, buckets: list[tuple[str, Limit]]) -> float:
+        if self._script is None:
+            self._script = redis.register_script(_TOKEN_BUCKET_SCRIPT)
+        args = [value for _, limit in buckets for value in (limit.capacity, limit.rate)]
+        retry_after = await self._script(
+            keys=[f"{self.prefix}:{key}" for key, _ in buckets], args=args, client=redis_manager.client
+        )
+        return float(retry_after)
+
+    def _hit_local(self, buckets: list[tuple[str, Limit]]) -> float:
+        now = time.monotonic()
+        tokens = []
+        for key, limit in buckets:
+            available, updated_at = self._local.get(key) or (limit.capacity, now)
+            tokens.append(min(limit.capacity, available + (now - updated_at) * limit.rate))
+        retry_after = max(((1 - available) / limit.rate for available, (_, limit) in zip(tokens, buckets)
+                           if available < 1), default=0.0)
+        if retry_after == 0:
+            for available, (key, limit) in zip(tokens, buckets):
+                self._local.set(key, (available - 1, now), ttl=limit.period)
+        return retry_after
+
+    async def hit(self, buckets: list[tuple[str, Limit]]) -> float:
+        """
+        Take one token from every bucket if all of them have it
+        :param buckets: Bucket keys with their limits
+        :return: Seconds to wait before retry, 0 if request is allowed
+        """
+        if not buckets:
+            return 0.0
+        try:
+            return await self._hit_redis(buckets)
+        except RedisError:
+            return self._hit_local(buckets)
+
+
+rate_limiter = RateLimiter()
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()[:16]
+
+
+async def username_from_body(request: Request) -> str | None:
+    """
+    Username of JSON request body, e.g. login form
+    :param request:
+    :return:
+    """
+    try:
+        body = await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    username = body.get("username") if isinstance(body, dict) else None
+    return username.lower() if isinstance(username, str) else None
+
+
+class RateLimit:
+    """
+    Route dependency limiting requests per client IP and per username.
+
+    Default usage:
+        @router.post('/login', dependencies=[Depends(RateLimit("login", ip="20/minute", username="5/minute"))])
+    """
+
+    def __init__(self,
+                 scope: str,
+                 ip: str | None = None,
+                 username: str | None = None,
+                 get_username: Callable = username_from_body) -> None:
+        """
+        :param scope: Name of limited action, buckets are separate per scope
+        :param ip: Limit per client IP, like "20/minute"
+        :param username: Limit per username, like "5/minute"
+        :param get_username: Extracts username from request
+        """
+        self.scope = scope
+        self.ip_limit = Limit.parse(ip) if ip else None
+        self.username_limit = Limit.parse(username) if username else None
+        self.get_username = get_username
+
+    async def __call__(self, request: Request) -> None:
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        buckets = []
+        if self.ip_limit and request.client:
+            buckets.append((f"{self.scope}:ip:{request.client.host}", self.ip_limit))
+        if self.username_limit and (username := await self.get_username(request)):
+            buckets.append((f"{self.scope}:username:{_digest(username)}", self.username_limit))
+
+        if (retry_after := await rate_limiter.hit(buckets)) > 0:
+            rate_limited.inc(scope=self.scope)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests. Try again later.",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
@@ -0,0 +1,174 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+Redis read-through cache of serialized responses.
+
+Entries are tagged, so writes can invalidate every response built from
+the changed entities. Stale entries are served while being refreshed
+in background.
+
+Invalidations that couldn't be done (Redis unavailable) are kept in process
+and retried on every lookup, the cache is bypassed by this process until
+they succeed.
+"""
+
+import asyncio
+import contextlib
+import datetime
+import hashlib
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from redis.commands.core import AsyncScript
+from redis.exceptions import RedisError
+
+from simpleo.core.config import settings
+from simpleo.core.connections.redis import batch, redis, redis_manager
+from simpleo.core.connections.table_data_gateways import QueryTimeout
+
+
+@dataclass
+class CachedResponse:
+    """
+    Response body with its validators and cache tags
+    """
+    body: bytes
+    etag: str | None = None
+    last_modified: datetime.datetime | None = None
+    tags: list[str] = field(default_factory=list)
+
+
+Producer = Callable[[], Awaitable[CachedResponse | None]]
+
+_INVALIDATE_TAGS_SCRIPT = """
+for _, tag in ipairs(KEYS) do
+    local keys = redis.call('SMEMBERS', tag)
+    for _, key in ipairs(keys) do
+        redis.call('DEL', key)
+    end
+    redis.call('DEL', tag)
+end
+return 0
+"""
+
+
+class ResponseCache:
+    """
+    Cache of response bodies keyed by route and normalized query parameters
+    """
+
+    def __init__(self, prefix: str = "response-cache") -> None:
+        """
+        :param prefix: Redis key prefix
+        """
+        self.prefix = prefix
+        self._invalidate_tags_script: AsyncScript | None = None
+        self._refreshing: set[asyncio.Task] = set()
+        self._pending_tags: set[str] = set()
+
+    def _key(self, route: str, params: dict[str, Any]) -> str:
+        normalized = "&".join(f"{name}={value}" for name, value in sorted(params.items()) if value is not None)
+        return f"{self.prefix}:{route}:{hashlib.sha1(normalized.encode('utf-8')).hexdigest()}"
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.prefix}-tag:{tag}"
+
+    async def _store(self, key: str, route: str, response: CachedResponse) -> None:
+        ttl = settings.RESPONSE_CACHE_TTL.get(route, settings.RESPONSE_CACHE_DEFAULT_TTL)
+        expire = ttl + settings.RESPONSE_CACHE_STALE_TTL
+        header = json.dumps({
+            "fresh_until": time.time() + ttl,
+            "etag": response.etag,
+            "last_modified": response.last_modified.isoformat() if response.last_modified else None,
+        })
+        # Tag sets are shared by routes, so they outlive the longest cached entry
+        tag_expire = max(settings.RESPONSE_CACHE_DEFAULT_TTL, *settings.RESPONSE_CACHE_TTL.values()) \
+            + settings.RESPONSE_CACHE_STALE_TTL
+        async with batch() as pipe:
+            pipe.set(key, header.encode("utf-8") + b"\n" + response.body, ex=expire)
+            for tag in set(response.tags):
+                pipe.sadd(self._tag_key(tag), key)
+                pipe.expire(self._tag_key(tag), tag_expire)
+
+    async def _produce_and_store(self, key: str, route: str, produce: Producer) -> CachedResponse | None:
+        if (response := await produce()) is None:
+            return None
+        with contextlib.suppress(RedisError):
+            await self._store(key, route, response)
+        return response
+
+    async def _refresh(self, key: str, route: str, produce: Producer) -> None:
+        # Stale entry stays until next refresh when the database is slow
+        with contextlib.suppress(RedisError, QueryTimeout):
+            if await redis.set(f"{key}:refresh", 1, nx=True, ex=settings.RESPONSE_CACHE_STALE_TTL or 1):
+                await self._produce_and_store(key, route, produce)
+
+    async def get_or_set(self, route: str, params: dict[str, Any], produce: Producer) -> CachedResponse | None:
+        """
+        Get cached response or produce it and put to cache.
+        :param route: route name, TTL is configured per route
+        :param params: request parameters making response unique
+        :param produce: returns response or None if response must not be cached
+        :return:
+        """
+        if not settings.RESPONSE_CACHE_ENABLED:
+            return await produce()
+        if self._pending_tags and not await self._flush_pending_tags():
+            return await produce()
+
+        key = self._key(route, params)
+        try:
+            cached = await redis.get(key)
+        except RedisError:
+            cached = None
+        if cached is None:
+            return await self._produce_and_store(key, route, produce)
+
+        header, _, body = cached.partition(b"\n")
+        header = json.loads(header)
+        if header["fresh_until"] < time.time():
+            task = asyncio.create_task(self._refresh(key, route, produce))
+            self._refreshing.add(task)
+            task.add_done_callback(self._refreshing.discard)
+        return CachedResponse(
+            body=body,
+            etag=header["etag"],
+            last_modified=datetime.datetime.fromisoformat(header["last_modified"]) if header["last_modified"] else None,
+        )
+
+    async def invalidate_tags(self, *tags: str) -> None:
+        """
+        Drop all responses tagged by any of tags.
+        Raises RedisError, writes run it as background task to be retried.
+        :param tags:
+        :return:
+        """
+        if self._invalidate_tags_script is None:
+            self._invalidate_tags_script = redis.register_script(_INVALIDATE_TAGS_SCRIPT)
+        # client is passed explicitly, it is recreated after fork
+        await self._invalidate_tags_script(keys=[self._tag_key(tag) for tag in tags], client=redis_manager.client)
+
+    def invalidate_tags_later(self, *tags: str) -> None:
+        """
+        Remember tags whose invalidation failed, they are retried on next lookup
+        :param tags:
+        :return:
+        """
+        self._pending_tags.update(tags)
+
+    async def _flush_pending_tags(self) -> bool:
+        tags = set(self._pending_tags)
+        try:
+            await self.invalidate_tags(*tags)
+        except RedisError:
+            return False
+        self._pending_tags -= tags
+        return True
+
+
+response_cache = ResponseCache()
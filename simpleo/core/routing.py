@@ -0,0 +1,103 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+Fast response serialization.
+
+FastAPI validates every returned value against response_model once more and
+encodes it with stdlib json. Routes of FastResponseRoute skip both when the
+endpoint already returns exactly the declared model (or list of it).
+"""
+
+import asyncio
+import functools
+import json
+import typing
+from typing import Any, Callable, Coroutine
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, TypeAdapter
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+@functools.lru_cache(maxsize=None)
+def _list_adapter(model: type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(list[model])
+
+
+class ModelJSONResponse(Response):
+    """
+    JSON response rendering pydantic models by pydantic-core serializer.
+    Other content is rendered by orjson if it is installed.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return content.__pydantic_serializer__.to_json(content, by_alias=True)
+        if isinstance(content, list) and content and isinstance(content[0], BaseModel):
+            return _list_adapter(type(content[0])).dump_json(content, by_alias=True)
+        if orjson is not None:
+            return orjson.dumps(content)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _is_declared(result: Any, model: Any) -> bool:
+    """
+    Check that result has exactly declared type, so re-validation changes nothing
+    """
+    if typing.get_origin(model) is list:
+        (item_model,) = typing.get_args(model)
+        return isinstance(result, list) and all(type(item) is item_model for item in result)
+    return type(result) is model
+
+
+class FastResponseRoute(APIRoute):
+    """
+    Route serializing declared response models without re-validation.
+
+    Usage:
+        router = APIRouter(route_class=FastResponseRoute)
+    """
+
+    def _fast_path_enabled(self) -> bool:
+        return (
+            self.response_model is not None
+            and self.response_model_include is None
+            and self.response_model_exclude is None
+            and not self.response_model_exclude_unset
+            and not self.response_model_exclude_defaults
+            and not self.response_model_exclude_none
+        )
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        if self._fast_path_enabled() and self.dependant.call is not None:
+            self.dependant.call = self._wrap(self.dependant.call)
+        return super().get_route_handler()
+
+    def _wrap(self, call: Callable[..., Any]) -> Callable[..., Any]:
+        model = self.response_model
+        status_code = self.status_code
+
+        def respond(result: Any) -> Any:
+            if _is_declared(result, model):
+                return ModelJSONResponse(result, status_code=status_code or 200)
+            return result
+
+        if asyncio.iscoroutinefunction(call):
+            @functools.wraps(call)
+            async def async_endpoint(*args: Any, **kwargs: Any) -> Any:
+                return respond(await call(*args, **kwargs))
+            return async_endpoint
+
+        @functools.wraps(call)
+        def endpoint(*args: Any, **kwargs: Any) -> Any:
+            return respond(call(*args, **kwargs))
+        return endpoint
@@ -9,9 +9,12 @@ Shared schemas
 
 import datetime
 import uuid
+from typing import Generic, TypeVar
 
 from pydantic import BaseModel
 
+ITEM_TYPE = TypeVar("ITEM_TYPE")
+
 
 class Auditable(BaseModel):
     """
@@ -20,3 +23,12 @@ class Auditable(BaseModel):
     id: uuid.UUID
     created_at: datetime.datetime | None = None
     updated_at: datetime.datetime | None = None
+
+
+class Page(BaseModel, Generic[ITEM_TYPE]):
+    """
+    Page of keyset pagination
+    """
+    items: list[ITEM_TYPE]
+    next_cursor: str | None = None
+    prev_cursor: str | None = None
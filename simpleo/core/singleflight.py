@@ -0,0 +1,82 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+Single-flight coalescing of identical concurrent calls.
+
+The first caller of a key starts the call as a separate task, callers
+arriving while it is in flight wait for the same task and get its result
+or its exception. The call is not cancelled when its first caller is, and
+every caller waits at most timeout seconds.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+from simpleo.core.config import settings
+from simpleo.core.metrics import Counter, registry
+
+coalesced_calls = registry.register(Counter(
+    "simpleo_singleflight_coalesced_total", "Calls served by a call already in flight", ("name",),
+))
+
+
+class SingleFlight:
+    """
+    Shares in-flight calls between callers of the same key.
+
+    Default usage:
+        news = await single_flight.do(("news", news_id), lambda: load_news(news_id))
+    """
+
+    def __init__(self, name: str, timeout: float) -> None:
+        """
+        :param name: Label of coalesced calls counter
+        :param timeout: Seconds every caller waits for the call
+        """
+        self.name = name
+        self.timeout = timeout
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+    def _forget(self, key: Hashable, call: asyncio.Task) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def _done(self, key: Hashable, call: asyncio.Task) -> None:
+        self._forget(key, call)
+        # Mark exception as retrieved, every caller may have timed out already
+        if not call.cancelled():
+            call.exception()
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Call func or join the call of the same key in flight
+        :param key: Identifies equal calls, must include everything the result depends on
+        :param func: Makes the call
+        :return: Result of the call
+        """
+        if (call := self._calls.get(key)) is not None:
+            coalesced_calls.inc(name=self.name)
+        else:
+            call = self._calls[key] = asyncio.ensure_future(func())
+            call.add_done_callback(lambda done: self._done(key, done))
+        try:
+            # shield keeps the call running for other callers when this one is cancelled or times out
+            return await asyncio.wait_for(asyncio.shield(call), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            # Callers arriving later start a new call instead of joining the stuck one
+            self._forget(key, call)
+            raise
+
+    @property
+    def in_flight(self) -> int:
+        """
+        Number of calls in flight
+        :return:
+        """
+        return len(self._calls)
+
+
+single_flight = SingleFlight("database", timeout=settings.SINGLE_FLIGHT_TIMEOUT)
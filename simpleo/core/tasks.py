@@ -0,0 +1,337 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+Background task queue for side effects of writes.
+
+Tasks are registered by name and enqueued with JSON-compatible arguments,
+workers of the current process run them with retries and exponential
+backoff. Tasks must be idempotent: they may run again after a retry or
+after a crash in durable mode.
+
+Backoff never runs on the request path: jobs run inline (queue not started)
+get one attempt, and a job that doesn't fit into a full queue runs inline
+once as well, slowing the writer down instead of losing the job. Jobs of
+tasks that need Redis are not retried on Redis connection errors, and while
+Redis is known to be down they are not run at all.
+
+A job that is not done (Redis down, or failed after all attempts) breaks
+whatever it was keeping consistent, so tasks register an on_lost hook
+that marks the dependent state invalid. The hook gets the job arguments
+and must not rely on Redis.
+
+In durable mode jobs are kept in a Redis list and every process pulls from
+it, jobs taken by a process that died are returned to the list on startup.
+If Redis is unavailable jobs go to the in-process queue.
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import socket
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+import pydantic_core
+from redis.exceptions import ConnectionError as RedisConnectionError, RedisError, TimeoutError as RedisTimeoutError
+
+from simpleo.core.config import settings
+from simpleo.core.connections.redis import redis
+from simpleo.core.metrics import Counter, Gauge, registry
+
+logger = logging.getLogger(__name__)
+
+TaskFunction = Callable[..., Awaitable[None]]
+
+tasks_processed = registry.register(Counter(
+    "simpleo_tasks_total", "Background tasks by result", ("task", "result"),
+))
+
+
+@dataclass
+class Job:
+    """
+    Task call
+    """
+    name: str
+    kwargs: dict[str, Any]
+
+    def dumps(self) -> str:
+        """
+        Serialize job
+        :return:
+        """
+        return json.dumps({"name": self.name, "kwargs": self.kwargs})
+
+    @classmethod
+    def loads(cls, raw: str | bytes) -> "Job":
+        """
+        Deserialize job
+        :param raw:
+        :return:
+        """
+        data = json.loads(raw)
+        return cls(name=data["name"], kwargs=data["kwargs"])
+
+
+class TaskQueue:
+    """
+    Bounded queue with worker tasks.
+
+    Default usage:
+        @task_queue.task("news.reindex")
+        async def reindex(news_id: str) -> None:
+            ...
+
+        await task_queue.enqueue(reindex, news_id=news.id)
+    """
+
+    def __init__(self,
+                 workers: int,
+                 capacity: int,
+                 max_attempts: int,
+                 retry_backoff: float,
+                 durable: bool = False,
+                 prefix: str = "task-queue") -> None:
+        """
+        :param workers: Worker tasks per process
+        :param capacity: Maximum of jobs waiting in process, further jobs are dropped
+        :param max_attempts: Attempts per job including the first one
+        :param retry_backoff: Delay before the first retry, doubled for every next one
+        :param durable: Keep jobs in Redis list
+        :param prefix: Redis key prefix
+        """
+        self.workers = workers
+        self.capacity = capacity
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.durable = durable
+        self.prefix = prefix
+        self.consumer = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: dict[str, TaskFunction] = {}
+        self._names: dict[TaskFunction, str] = {}
+        self._needs_redis: set[str] = set()
+        self._on_lost: dict[str, TaskFunction] = {}
+        self._redis_down_until = 0.0
+        self._queue: asyncio.Queue[Job] | None = None
+        self._workers: list[asyncio.Task] = []
+        self._stopping = False
+
+    @property
+    def pending_key(self) -> str:
+        return f"{self.prefix}:pending"
+
+    @property
+    def processing_key(self) -> str:
+        return f"{self.prefix}:processing:{self.consumer}"
+
+    def _heartbeat_key(self, consumer: str) -> str:
+        return f"{self.prefix}:consumer:{consumer}"
+
+    def task(self,
+             name: str,
+             needs_redis: bool = False,
+             on_lost: TaskFunction | None = None) -> Callable[[TaskFunction], TaskFunction]:
+        """
+        Register task function under name
+        :param name:
+        :param needs_redis: Task can't do anything without Redis, it is skipped while Redis is down
+        :param on_lost: Called with job arguments when a job is not done
+        :return:
+        """
+        def decorator(func: TaskFunction) -> TaskFunction:
+            self._tasks[name] = func
+            self._names[func] = name
+            if needs_redis:
+                self._needs_redis.add(name)
+            if on_lost is not None:
+                self._on_lost[name] = on_lost
+            return func
+        return decorator
+
+    @property
+    def redis_down(self) -> bool:
+        """
+        Redis failed to connect recently
+        :return:
+        """
+        return time.monotonic() < self._redis_down_until
+
+    async def _lose(self, job: Job, result: str) -> None:
+        tasks_processed.inc(task=job.name, result=result)
+        if (on_lost := self._on_lost.get(job.name)) is None:
+            return
+        try:
+            await on_lost(**job.kwargs)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("on_lost hook of task %s failed", job.name)
+
+    @property
+    def size(self) -> int:
+        """
+        Jobs waiting in process
+        :return:
+        """
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def enqueue(self, task: str | TaskFunction, **kwargs: Any) -> None:
+        """
+        Schedule task. Runs it inline once when queue is not started or full.
+        :param task: Registered task function or its name
+        :param kwargs: Arguments, converted to JSON-compatible values
+        :return:
+        """
+        name = task if isinstance(task, str) else self._names.get(task)
+        if name not in self._tasks:
+            raise KeyError(f"Unknown task {task}")
+        job = Job(name, pydantic_core.to_jsonable_python(kwargs))
+        if name in self._needs_redis and self.redis_down:
+            # Not logged, the outage itself is
+            await self._lose(job, "dropped")
+            return
+        if self._queue is None or self._stopping:
+            await self._run(job, retry=False)
+            return
+        if self.durable:
+            try:
+                await redis.lpush(self.pending_key, job.dumps())
+                return
+            except RedisError:
+                pass
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            # Backpressure, the writer waits for its own job
+            tasks_processed.inc(task=job.name, result="overflow")
+            await self._run(job, retry=False)
+
+    async def _run(self, job: Job, retry: bool = True) -> None:
+        """
+        Run job retrying it with exponential backoff
+        :param job:
+        :param retry: Retry failed job, backoff delays the caller
+        :return:
+        """
+        attempts = self.max_attempts if retry else 1
+        for attempt in range(1, attempts + 1):
+            try:
+                await self._tasks[job.name](**job.kwargs)
+            except (RedisConnectionError, RedisTimeoutError):
+                if not self.redis_down:
+                    logger.warning("Redis is unavailable, skipping tasks that need it for %.0f s",
+                                   settings.TASK_QUEUE_REDIS_DOWN_TIMEOUT)
+                self._redis_down_until = time.monotonic() + settings.TASK_QUEUE_REDIS_DOWN_TIMEOUT
+                await self._lose(job, "dropped")
+                return
+            except Exception:  # pylint: disable=broad-except
+                if attempt == attempts:
+                    logger.exception("Task %s failed after %d attempts", job.name, attempt)
+                    await self._lose(job, "failed")
+                    return
+                tasks_processed.inc(task=job.name, result="retried")
+                await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
+            else:
+                tasks_processed.inc(task=job.name, result="done")
+                return
+
+    async def _next_durable_job(self) -> tuple[Job, bytes] | None:
+        with contextlib.suppress(RedisError):
+            if raw := await redis.blmove(self.pending_key, self.processing_key, 1, "RIGHT", "LEFT"):
+                return Job.loads(raw), raw
+        return None
+
+    async def _work(self) -> None:
+        while True:
+            if not self._queue.empty() or not self.durable:
+                job = await self._queue.get()
+                try:
+                    await self._run(job)
+                finally:
+                    self._queue.task_done()
+                continue
+            if self._stopping:
+                return
+            if (durable_job := await self._next_durable_job()) is not None:
+                job, raw = durable_job
+                await self._run(job)
+                with contextlib.suppress(RedisError):
+                    await redis.lrem(self.processing_key, 1, raw)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            with contextlib.suppress(RedisError):
+                await redis.set(self._heartbeat_key(self.consumer), 1, ex=settings.TASK_QUEUE_HEARTBEAT_TTL)
+            await asyncio.sleep(settings.TASK_QUEUE_HEARTBEAT_TTL / 3)
+
+    async def recover(self) -> int:
+        """
+        Return jobs taken by dead processes to pending list
+        :return: Number of returned jobs
+        """
+        recovered = 0
+        with contextlib.suppress(RedisError):
+            async for key in redis.scan_iter(match=f"{self.prefix}:processing:*"):
+                consumer = key.decode("utf-8").removeprefix(f"{self.prefix}:processing:")
+                if consumer != self.consumer and await redis.exists(self._heartbeat_key(consumer)):
+                    continue
+                while await redis.lmove(key, self.pending_key, "RIGHT", "RIGHT"):
+                    recovered += 1
+        if recovered:
+            logger.warning("Recovered %d background jobs", recovered)
+        return recovered
+
+    async def start(self) -> None:
+        """
+        Start workers
+        :return:
+        """
+        if self._queue is not None:
+            return
+        self._stopping = False
+        self._queue = asyncio.Queue(maxsize=self.capacity)
+        if self.durable:
+            await self.recover()
+            self._workers.append(asyncio.create_task(self._heartbeat()))
+        self._workers += [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float) -> None:
+        """
+        Stop taking new durable jobs, drain in-process queue and stop workers
+        :param timeout: Seconds to wait for queued jobs
+        :return:
+        """
+        if self._queue is None:
+            return
+        self._stopping = True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Task queue drain timed out, %d jobs left", self._queue.qsize())
+        for worker in self._workers:
+            worker.cancel()
+        for worker in self._workers:
+            with contextlib.suppress(asyncio.CancelledError):
+                await worker
+        self._workers.clear()
+        self._queue = None
+        if self.durable:
+            with contextlib.suppress(RedisError):
+                await redis.delete(self._heartbeat_key(self.consumer))
+
+
+task_queue = TaskQueue(
+    workers=settings.TASK_QUEUE_WORKERS,
+    capacity=settings.TASK_QUEUE_CAPACITY,
+    max_attempts=settings.TASK_QUEUE_MAX_ATTEMPTS,
+    retry_backoff=settings.TASK_QUEUE_RETRY_BACKOFF,
+    durable=settings.TASK_QUEUE_DURABLE,
+)
+
+registry.register(Gauge(
+    "simpleo_task_queue_size", "Background jobs waiting in this process", function=lambda: task_queue.size,
+))
@@ -7,20 +7,124 @@
 Shared utils
 """
 
+import types
+import typing
 import uuid
-from typing import TypeVar, Type, Annotated
+from typing import Any, Iterable, TypeVar, Type, Annotated
 
 import edgedb
 from fastapi import HTTPException, status, UploadFile
+from pydantic import BaseModel
 
 PD_MODEL_TYPE = TypeVar("PD_MODEL_TYPE")
 
 
-def make_pydantic_model(model: Type[PD_MODEL_TYPE], obj: edgedb.Object) -> PD_MODEL_TYPE:
+def _nested_model(annotation: Any) -> tuple[Type[BaseModel] | None, bool]:
+    """
+    Find pydantic model inside field annotation
+    :param annotation:
+    :return: model or None and flag if field is list of models
+    """
+    origin = typing.get_origin(annotation)
+    if origin in (typing.Union, types.UnionType):
+        for arg in typing.get_args(annotation):
+            if (found := _nested_model(arg))[0] is not None:
+                return found
+        return None, False
+    if origin is list:
+        return _nested_model(typing.get_args(annotation)[0])[0], True
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation, False
+    return None, False
+
+
+class ModelConverter:
+    """
+    Converts EdgeDB Objects of one shape to pydantic model.
+    Field accessors are computed once per (model, shape) pair.
+    """
+
+    __slots__ = ("model", "fields")
+
+    def __init__(self, model: Type[BaseModel], shape: tuple[str, ...]) -> None:
+        """
+        :param model: pydantic model
+        :param shape: names of EdgeDB Object fields
+        """
+        self.model = model
+        self.fields = [
+            (name, *_nested_model(field.annotation))
+            for name, field in model.model_fields.items()
+            if name in shape
+        ]
+
+    def _values(self, obj: edgedb.Object, trusted: bool) -> dict[str, Any]:
+        values = {}
+        for name, nested, is_list in self.fields:
+            value = getattr(obj, name)
+            if nested is not None and value is not None:
+                if is_list:
+                    value = make_pydantic_models(nested, value, trusted)
+                else:
+                    value = make_pydantic_model(nested, value, trusted)
+            values[name] = value
+        return values
+
+    def convert(self, obj: edgedb.Object, trusted: bool = True) -> BaseModel:
+        """
+        Convert EdgeDB Object.
+        Trusted objects come from typed EdgeQL and are not validated again.
+        :param obj:
+        :param trusted:
+        :return:
+        """
+        values = self._values(obj, trusted)
+        if trusted:
+            return self.model.model_construct(**values)
+        return self.model.model_validate(values)
+
+
+_converters: dict[tuple[type, tuple[str, ...]], ModelConverter] = {}
+
+
+def get_converter(model: Type[BaseModel], obj: edgedb.Object) -> ModelConverter:
+    """
+    Get converter for model and shape of EdgeDB Object
+    :param model:
+    :param obj:
+    :return:
+    """
+    key = (model, tuple(obj.__dir__()))
+    if (converter := _converters.get(key)) is None:
+        converter = _converters[key] = ModelConverter(model, key[1])
+    return converter
+
+
+def make_pydantic_model(model: Type[PD_MODEL_TYPE], obj: edgedb.Object, trusted: bool = True) -> PD_MODEL_TYPE:
     """
     Make pydantic model from EdgeDB Object
     :param model:
     :param obj:
+    :param trusted: skip validation of object from typed EdgeQL
+    :return:
+    """
+    if isinstance(obj, model):
+        return obj
+    return get_converter(model, obj).convert(obj, trusted)
+
+
+def make_pydantic_models(model: Type[PD_MODEL_TYPE],
+                         objs: Iterable[edgedb.Object],
+                         trusted: bool = True) -> list[PD_MODEL_TYPE]:
+    """
+    Make pydantic models from EdgeDB Objects of one shape
+    :param model:
+    :param objs:
+    :param trusted: skip validation of objects from typed EdgeQL
     :return:
     """
-    return model.model_validate({arg: obj.__getattribute__(arg) for arg in obj.__dir__()})
+    objs = list(objs)
+    if not objs:
+        return []
+    converter = get_converter(model, objs[0])
+    return [converter.convert(obj, trusted) for obj in objs]
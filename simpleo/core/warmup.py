@@ -0,0 +1,110 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+Startup warm-up and readiness state.
+
+Worker is ready when EdgeDB and Redis connections are opened and every
+registered TDG read query has been compiled by EdgeDB once.
+"""
+
+import asyncio
+import contextlib
+import logging
+import uuid
+
+import edgedb
+from redis.exceptions import RedisError
+
+from simpleo.core.connections.edgedb import client as database_client
+from simpleo.core.connections.redis import redis
+from simpleo.core.connections.table_data_gateways import BaseTableDataGateway
+
+logger = logging.getLogger(__name__)
+
+WARMUP_USER_ID = uuid.UUID(int=0)
+RETRY_DELAY = 2.0
+
+_ready = asyncio.Event()
+_warmup_task: asyncio.Task | None = None
+
+
+class _Rollback(Exception):
+    """
+    Raised to roll back warm-up transaction
+    """
+
+
+def is_ready() -> bool:
+    """
+    Check if worker is warmed up
+    :return:
+    """
+    return _ready.is_set()
+
+
+async def _warm_up_call(gateway_class: type[BaseTableDataGateway], method: str, kwargs: dict) -> None:
+    """
+    Call TDG method inside a transaction that is always rolled back
+    """
+    gateway = gateway_class(user_id=WARMUP_USER_ID)
+    try:
+        async for transaction in gateway.database.transaction():
+            async with transaction:
+                gateway.database = transaction
+                await getattr(gateway, method)(**kwargs)
+                raise _Rollback
+    except _Rollback:
+        pass
+    except (OSError, edgedb.errors.ClientConnectionError, RedisError):
+        raise
+    except Exception:  # pylint: disable=broad-except
+        logger.warning("Warm-up of %s.%s failed", gateway_class.__name__, method, exc_info=True)
+
+
+async def warm_up() -> None:
+    """
+    Open connections and compile registered queries
+    :return:
+    """
+    await database_client.ensure_connected()
+    await redis.ping()
+    for gateway_class in BaseTableDataGateway.registry:
+        for method, kwargs in gateway_class.warmup_calls:
+            await _warm_up_call(gateway_class, method, kwargs)
+    _ready.set()
+
+
+async def _warm_up_until_ready() -> None:
+    while True:
+        try:
+            await warm_up()
+            return
+        except (OSError, edgedb.errors.EdgeDBError, RedisError):
+            await asyncio.sleep(RETRY_DELAY)
+
+
+def start_warm_up() -> None:
+    """
+    Start warm-up in background, worker serves requests meanwhile
+    :return:
+    """
+    global _warmup_task  # pylint: disable=global-statement
+    if _warmup_task is None:
+        _warmup_task = asyncio.create_task(_warm_up_until_ready())
+
+
+async def stop_warm_up() -> None:
+    """
+    Cancel warm-up if it is still running
+    :return:
+    """
+    global _warmup_task  # pylint: disable=global-statement
+    if _warmup_task is not None:
+        _warmup_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await _warmup_task
+        _warmup_task = None
+    _ready.clear()
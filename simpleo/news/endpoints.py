@@ -7,50 +7,260 @@
 News module endpoints
 """
 
+from typing import AsyncIterator
 from uuid import UUID
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import Response, StreamingResponse
 
 from simpleo.auth.dependencies import AccessControl
 from simpleo.auth.schemas import User
+from simpleo.core.config import settings
+from simpleo.core.pagination import decode_cursor, decode_score_cursor
+from simpleo.core.projections import parse_fields
+from simpleo.core.queries import skip_query_checks
+from simpleo.core.conditional import body_etag, has_conditions, is_not_modified, not_modified, set_validators
+from simpleo.core.response_cache import CachedResponse, response_cache
+from simpleo.core.routing import FastResponseRoute
+from simpleo.core.schemas import Page
 
-from simpleo.news.table_data_gateways.news import NewsTDG
+from simpleo.news.table_data_gateways.news import (
+    NEWS_FIELDS,
+    NewsIterationError,
+    NewsTDG,
+    news_cache_tags,
+    news_projection,
+    news_validators
+)
 from simpleo.news.schemas import (
     News,
     CreateNewsRequestSchema,
     CreateUpdateNewsResponseSchema,
     UpdateNewsRequestSchema,
-    DeleteNewsResponseSchema
+    DeleteNewsResponseSchema,
+    BulkCreateNewsRequestSchema,
+    BulkUpdateNewsRequestSchema,
+    BulkDeleteNewsRequestSchema,
+    BulkNewsItemResultSchema,
+    BulkNewsResponseSchema
 )
 
-router = APIRouter()
+router = APIRouter(route_class=FastResponseRoute)
+
+FIELDS_DESCRIPTION = "Comma separated fields to return, e.g. id,title,user.username"
 
 
-@router.get("/", response_model=list[News])
+@router.get("/", response_model=Page[News])
 async def get_news_filter(
+        request: Request,
         user_id: UUID | None = None,
         title: str | None = None,
+        q: str | None = Query(None, min_length=1),
+        limit: int = Query(settings.NEWS_PAGE_SIZE_DEFAULT, ge=1),
+        after: str | None = None,
+        before: str | None = None,
+        fields: str | None = Query(None, description=FIELDS_DESCRIPTION),
 ):
     """
-    Get news with filtering
+    Get page of news with filtering.
+    Use next_cursor as `after` and prev_cursor as `before` to get neighbour pages.
+    With `q` news are searched by title and content and ordered by relevance,
+    only `after` is supported in this mode.
     """
-    return await NewsTDG().get(
-        user_id=user_id,
-        title=title
+    limit = min(limit, settings.NEWS_PAGE_SIZE_MAX)
+    if q and before:
+        raise HTTPException(
+            status_code=400,
+            detail="Cursor `before` is not supported by search."
+        )
+    after_key = (decode_score_cursor(after) if q else decode_cursor(after)) if after else None
+    before_key = decode_cursor(before) if before else None
+    requested_fields = parse_fields(fields, NEWS_FIELDS)
+    projection = news_projection(requested_fields)
+
+    async def produce() -> CachedResponse | None:
+        if q:
+            news = await NewsTDG().search(
+                text=q, user_id=user_id, title=title, limit=limit, after=after_key, projection=projection
+            )
+        else:
+            news = await NewsTDG().get(
+                user_id=user_id, title=title, limit=limit, after=after_key, before=before_key, projection=projection
+            )
+        if news is None:
+            return None
+        include = {"items": {"__all__": projection.include}, "next_cursor": True, "prev_cursor": True} \
+            if projection else None
+        body = news.model_dump_json(include=include).encode("utf-8")
+        # No Last-Modified: deleting an item changes the list without changing its newest timestamp
+        return CachedResponse(
+            body=body,
+            etag=body_etag(body),
+            last_modified=None,
+            tags=["news-list"] + [tag for item in news.items for tag in news_cache_tags(item.id, item.user.id)],
+        )
+
+    params = {
+        "user_id": user_id, "title": title, "q": q, "limit": limit, "after": after, "before": before,
+        "fields": ",".join(sorted(requested_fields)) if requested_fields else None,
+    }
+    if cached := await response_cache.get_or_set("news-list", params, produce):
+        if is_not_modified(request, cached.etag, cached.last_modified):
+            return not_modified(cached.etag, cached.last_modified)
+        return set_validators(Response(cached.body, media_type="application/json"), cached.etag, cached.last_modified)
+    raise HTTPException(
+        status_code=500,
+        detail="Internal server error."
     )
 
 
-@router.get("/{news_uuid}", response_model=News)
+@router.get("/export", response_class=StreamingResponse, dependencies=[Depends(AccessControl())])
+async def export_news(
+        fields: str | None = Query(None, description=FIELDS_DESCRIPTION),
+):
+    """
+    Export all news as NDJSON stream, one news per line
+    """
+    projection = news_projection(parse_fields(fields, NEWS_FIELDS))
+    # One query per chunk is expected here
+    skip_query_checks()
+
+    # Export covers news of all authors, user globals would hide the author of other users' news
+    news_iterator = NewsTDG().iterate(chunk_size=settings.NEWS_EXPORT_CHUNK_SIZE, projection=projection)
+    # First page is read before the response starts, so its failure is returned as error status
+    try:
+        first = await anext(news_iterator, None)
+    except NewsIterationError:
+        raise HTTPException(
+            status_code=500,
+            detail="Internal server error."
+        )
+
+    def serialize(news: News) -> bytes:
+        return news.model_dump_json(include=projection.include if projection else None).encode("utf-8") + b"\n"
+
+    async def generate() -> AsyncIterator[bytes]:
+        # Later failure propagates and aborts the connection, client doesn't get a complete-looking export
+        if first is None:
+            return
+        yield serialize(first)
+        async for news in news_iterator:
+            yield serialize(news)
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@router.post("/bulk", response_model=BulkNewsResponseSchema)
+async def bulk_create_news(
+        news_data: BulkCreateNewsRequestSchema,
+        user: User = Depends(AccessControl())
+):
+    """
+    Create many news at once
+    """
+    if (news := await NewsTDG(user.id).bulk_create(
+            user_id=user.id,
+            items=[item.model_dump() for item in news_data.items]
+    )) is None:
+        raise HTTPException(
+            status_code=500,
+            detail="Internal server error."
+        )
+    return BulkNewsResponseSchema(results=[
+        BulkNewsItemResultSchema(
+            index=index,
+            id=item.id,
+            news=item
+        )
+        for index, item in enumerate(news)
+    ])
+
+
+@router.patch("/bulk", response_model=BulkNewsResponseSchema)
+async def bulk_update_news(
+        news_data: BulkUpdateNewsRequestSchema,
+        user: User = Depends(AccessControl())
+):
+    """
+    Update many news at once
+    """
+    if (news := await NewsTDG(user.id).bulk_update(
+            items=[item.model_dump(exclude_none=True) for item in news_data.items]
+    )) is None:
+        raise HTTPException(
+            status_code=500,
+            detail="Internal server error."
+        )
+    return BulkNewsResponseSchema(results=[
+        BulkNewsItemResultSchema(
+            index=index,
+            id=item.id,
+            news=news[item.id]
+        ) if item.id in news else BulkNewsItemResultSchema(
+            index=index,
+            id=item.id,
+            error="News with entered uuid not found."
+        )
+        for index, item in enumerate(news_data.items)
+    ])
+
+
+@router.post("/bulk/delete", response_model=BulkNewsResponseSchema)
+async def bulk_delete_news(
+        news_data: BulkDeleteNewsRequestSchema,
+        user: User = Depends(AccessControl())
+):
+    """
+    Delete many news at once
+    """
+    if (deleted := await NewsTDG(user.id).bulk_delete(news_ids=news_data.ids)) is None:
+        raise HTTPException(
+            status_code=500,
+            detail="Internal server error."
+        )
+    return BulkNewsResponseSchema(results=[
+        BulkNewsItemResultSchema(
+            index=index,
+            id=news_id,
+            error=None if news_id in deleted else "News with entered uuid not found."
+        )
+        for index, news_id in enumerate(news_data.ids)
+    ])
+
+
+@router.get("/{news_uuid}", response_model=News, dependencies=[Depends(AccessControl())])
 async def get_news_by_uuid(
+        request: Request,
         news_uuid: UUID,
-        user: User = Depends(AccessControl())
+        fields: str | None = Query(None, description=FIELDS_DESCRIPTION),
 ):
     """
     Get news by uuid
     """
-    if news := await NewsTDG(user.id).get_by_uuid(news_uuid):
-        return news
-    return HTTPException(
+    requested_fields = parse_fields(fields, NEWS_FIELDS)
+    projection = news_projection(requested_fields)
+    variant = ",".join(sorted(requested_fields)) if requested_fields else None
+
+    # Cached body is shared by all users, so it is rendered without user globals, whose access
+    # policies would hide the author of other users' news. The version is read the same way.
+    if has_conditions(request):
+        if (version := await NewsTDG().get_version(news_uuid, variant)) and is_not_modified(request, *version):
+            return not_modified(*version)
+
+    async def produce() -> CachedResponse | None:
+        if news := await NewsTDG().get_by_uuid(news_uuid, projection=projection):
+            etag, last_modified = news_validators(news, variant)
+            return CachedResponse(
+                body=news.model_dump_json(include=projection.include if projection else None).encode("utf-8"),
+                etag=etag,
+                last_modified=last_modified,
+                tags=news_cache_tags(news.id, news.user.id),
+            )
+        return None
+
+    if cached := await response_cache.get_or_set("news-detail", {"id": news_uuid, "fields": variant}, produce):
+        return set_validators(Response(cached.body, media_type="application/json"), cached.etag, cached.last_modified)
+    raise HTTPException(
         status_code=404,
         detail="News with entered uuid not found."
     )
@@ -4,8 +4,9 @@
 #  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
 from uuid import UUID
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
+from simpleo.core.config import settings
 from simpleo.core.schemas import Auditable
 from simpleo.auth.schemas import User
 
@@ -48,3 +49,48 @@ class DeleteNewsResponseSchema(BaseModel):
     DeleteNewsResponse schema
     """
     id: UUID
+
+
+class BulkUpdateNewsItemSchema(UpdateNewsRequestSchema):
+    """
+    BulkUpdateNewsItem schema
+    """
+    id: UUID
+
+
+class BulkCreateNewsRequestSchema(BaseModel):
+    """
+    BulkCreateNewsRequest schema
+    """
+    items: list[CreateNewsRequestSchema] = Field(min_length=1, max_length=settings.NEWS_BULK_MAX_SIZE)
+
+
+class BulkUpdateNewsRequestSchema(BaseModel):
+    """
+    BulkUpdateNewsRequest schema
+    """
+    items: list[BulkUpdateNewsItemSchema] = Field(min_length=1, max_length=settings.NEWS_BULK_MAX_SIZE)
+
+
+class BulkDeleteNewsRequestSchema(BaseModel):
+    """
+    BulkDeleteNewsRequest schema
+    """
+    ids: list[UUID] = Field(min_length=1, max_length=settings.NEWS_BULK_MAX_SIZE)
+
+
+class BulkNewsItemResultSchema(BaseModel):
+    """
+    Result of one bulk operation item
+    """
+    index: int
+    id: UUID | None = None
+    news: CreateUpdateNewsResponseSchema | None = None
+    error: str | None = None
+
+
+class BulkNewsResponseSchema(BaseModel):
+    """
+    BulkNewsResponse schema
+    """
+    results: list[BulkNewsItemResultSchema]
@@ -3,12 +3,100 @@
 #  Proprietary and confidential
 #  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
 
+import datetime
+import json
+from typing import Any, AsyncIterator
 from uuid import UUID
 
 import edgedb.errors
 
+from simpleo.core.conditional import make_etag
+from simpleo.core.connections.edgedb import client as database_client
 from simpleo.core.connections.table_data_gateways import BaseTableDataGateway
-from simpleo.news.schemas import News
+from simpleo.core.pagination import KeysetCursor, ScoreCursor, encode_cursor, encode_score_cursor
+from simpleo.core.projections import Projection, compile_projection
+from simpleo.core.tasks import task_queue
+from simpleo.core.schemas import Page
+from simpleo.core.utils import make_pydantic_model, make_pydantic_models
+from simpleo.news import tasks, timelines
+from simpleo.news.schemas import News, CreateUpdateNewsResponseSchema
+
+
+NEWS_SHAPE = "{*, user: {id, username, email, created_at, updated_at}}"
+
+NEWS_FIELDS = {
+    "id": frozenset({"id"}),
+    "title": frozenset({"title"}),
+    "content": frozenset({"content"}),
+    "created_at": frozenset({"created_at"}),
+    "updated_at": frozenset({"updated_at"}),
+    "user": frozenset({"user.id", "user.username", "user.email", "user.created_at", "user.updated_at"}),
+    "user.id": frozenset({"user.id"}),
+    "user.username": frozenset({"user.username"}),
+    "user.email": frozenset({"user.email"}),
+    "user.created_at": frozenset({"user.created_at"}),
+    "user.updated_at": frozenset({"user.updated_at"}),
+}
+
+# Needed by cursors, validators and cache tags whatever is requested
+NEWS_REQUIRED_FIELDS = frozenset({
+    "id", "created_at", "updated_at", "user.id", "user.created_at", "user.updated_at"
+})
+
+
+def news_projection(fields: frozenset[str] | None) -> Projection | None:
+    """
+    Compile news projection, None means full news
+    """
+    return compile_projection(fields, NEWS_REQUIRED_FIELDS) if fields else None
+
+
+def news_cache_tags(news_id: UUID, user_id: UUID) -> list[str]:
+    """
+    Response cache tags of news
+    """
+    return [f"news:{news_id}", f"user:{user_id}"]
+
+
+def news_validators(news: Any, variant: str | None = None) -> tuple[str, datetime.datetime | None]:
+    """
+    ETag and Last-Modified of news, they change with news and its author.
+    Variant distinguishes representations of the same news, e.g. projections.
+    """
+    changed_at = [
+        timestamp for timestamp in (news.updated_at or news.created_at, news.user.updated_at or news.user.created_at)
+        if timestamp
+    ]
+    parts = [news.id, *changed_at, variant] if variant else [news.id, *changed_at]
+    return make_etag(*parts), max(changed_at) if changed_at else None
+
+
+def keyset_page(news: list[News],
+                has_more: bool,
+                after: KeysetCursor | None,
+                before: KeysetCursor | None) -> Page[News]:
+    """
+    Page of news ordered newest first with cursors of its edges
+    :param news: Page items
+    :param has_more: Whether there are more items in reading direction
+    :param after: Cursor page was read after
+    :param before: Cursor page was read before
+    """
+    if before and not after:
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, after is not None
+    return Page[News](
+        items=news,
+        next_cursor=encode_cursor(news[-1].created_at, news[-1].id) if news and has_next else None,
+        prev_cursor=encode_cursor(news[0].created_at, news[0].id) if news and has_prev else None,
+    )
+
+
+class NewsIterationError(RuntimeError):
+    """
+    Page of news could not be read while iterating
+    """
 
 
 class NewsTDG(BaseTableDataGateway):
@@ -16,47 +104,237 @@ class NewsTDG(BaseTableDataGateway):
     News TDG
     """
 
+    warmup_calls = (
+        ("get", {}),
+        ("search", {"text": "warmup"}),
+        ("get_by_uuid", {"news_id": UUID(int=0)}),
+        ("get_by_ids", {"news_ids": [UUID(int=0)]}),
+        ("get_version", {"news_id": UUID(int=0)}),
+    )
+
     async def get(self,
                   user_id: UUID | None = None,
-                  title: str | None = None) -> list[News] | None:
+                  title: str | None = None,
+                  limit: int = 20,
+                  after: KeysetCursor | None = None,
+                  before: KeysetCursor | None = None,
+                  projection: Projection | None = None) -> Page[News] | None:
         """
-        Get news by filtering
+        Get page of news by filtering.
+        News are ordered from newest to oldest by (created_at, id),
+        after/before are keys of the last/first item of neighbour page.
+        Author feeds are read from timelines when they are built.
         """
         query = """
         with
             user_id := <optional uuid>$user_id,
-            title := <optional str>$title
-        select news::News {*, user: {*}}
+            title := <optional str>$title,
+            after_created_at := <optional datetime>$after_created_at,
+            after_id := <optional uuid>$after_id,
+            before_created_at := <optional datetime>$before_created_at,
+            before_id := <optional uuid>$before_id
+        select news::News %(shape)s
             filter
                 (.title ?= title or title ?= <optional str>{})
                 and
                 (.user ?= (select detached auth::User filter .id = user_id) or user_id ?= <optional uuid>{})
+                and
+                ((.created_at < after_created_at
+                  or (.created_at = after_created_at and .id < after_id)) ?? true)
+                and
+                ((.created_at > before_created_at
+                  or (.created_at = before_created_at and .id > before_id)) ?? true)
+            order by .created_at %(direction)s then .id %(direction)s
+            limit <int64>$limit
+        """ % {
+            "shape": projection.shape if projection else NEWS_SHAPE,
+            "direction": "asc" if before and not after else "desc",
+        }
+
+        if user_id is not None and title is None:
+            page = await self._get_from_timeline(user_id, limit, after, before, projection)
+            if page is not None:
+                return page
+
+        after_created_at, after_id = after or (None, None)
+        before_created_at, before_id = before or (None, None)
+        try:
+            news = list(await self.database.query(
+                query,
+                user_id=user_id,
+                title=title,
+                after_created_at=after_created_at,
+                after_id=after_id,
+                before_created_at=before_created_at,
+                before_id=before_id,
+                limit=limit + 1
+            ))
+        except edgedb.errors.EdgeDBError:
+            return None
+
+        has_more = len(news) > limit
+        news = make_pydantic_models(News, news[:limit])
+        if before and not after:
+            news.reverse()
+        return keyset_page(news, has_more, after, before)
+
+    async def _get_from_timeline(self,
+                                 user_id: UUID,
+                                 limit: int,
+                                 after: KeysetCursor | None,
+                                 before: KeysetCursor | None,
+                                 projection: Projection | None) -> Page[News] | None:
+        """
+        Get page of author news from timeline, None if timeline can't be used
         """
+        if (timeline := await timelines.read(user_id, limit, after, before)) is None:
+            return None
+        news_ids, has_more = timeline
+        news = await self.get_by_ids(news_ids, projection=projection)
+        if news is None:
+            return None
+        if len(news) < len(news_ids):
+            # Deleted while timeline was not updated
+            found = {item.id for item in news}
+            await task_queue.enqueue(tasks.remove_from_timelines,
+                                     news=[(news_id, user_id) for news_id in news_ids if news_id not in found])
+        return keyset_page(news, has_more, after, before)
 
+    async def search(self,
+                     text: str,
+                     user_id: UUID | None = None,
+                     title: str | None = None,
+                     limit: int = 20,
+                     after: ScoreCursor | None = None,
+                     projection: Projection | None = None) -> Page[News] | None:
+        """
+        Full-text search over news title and content.
+        News are ordered by relevance, after is key of the last item of previous page.
+        """
+        query = """
+        with
+            text := <str>$text,
+            user_id := <optional uuid>$user_id,
+            title := <optional str>$title,
+            after_score := <optional float32>$after_score,
+            after_id := <optional uuid>$after_id,
+            matches := (
+                select fts::search(news::News, text, language := 'eng')
+                filter
+                    (.object.title ?= title or title ?= <optional str>{})
+                    and
+                    (.object.user.id ?= user_id or user_id ?= <optional uuid>{})
+                    and
+                    ((.score < after_score
+                      or (.score = after_score and .object.id > after_id)) ?? true)
+                order by .score desc then .object.id
+                limit <int64>$limit
+            )
+        select (matches.object %(shape)s, matches.score)
+        """ % {"shape": projection.shape if projection else NEWS_SHAPE}
+
+        after_score, after_id = after or (None, None)
         try:
-            return await self.database.query(query, user_id=user_id, title=title)
-        except edgedb.errors.EdgeDBError as e:
+            matches = await self.database.query(
+                query,
+                text=text,
+                user_id=user_id,
+                title=title,
+                after_score=after_score,
+                after_id=after_id,
+                limit=limit + 1
+            )
+        except edgedb.errors.EdgeDBError:
             return None
 
-    async def get_by_uuid(self, news_id: UUID) -> News | None:
+        matches = sorted(matches, key=lambda match: (-match[1], match[0].id))
+        has_more = len(matches) > limit
+        matches = matches[:limit]
+        return Page[News](
+            items=make_pydantic_models(News, (item for item, _ in matches)),
+            next_cursor=encode_score_cursor(matches[-1][1], matches[-1][0].id) if matches and has_more else None,
+        )
+
+    async def iterate(self,
+                      chunk_size: int = 500,
+                      projection: Projection | None = None) -> AsyncIterator[News]:
+        """
+        Iterate over all news from newest to oldest, fetching them by pages.
+        Raises NewsIterationError if a page can't be read, so callers don't take partial results as complete.
+        """
+        after = None
+        while True:
+            if (page := await self.get(limit=chunk_size, after=after, projection=projection)) is None:
+                raise NewsIterationError("Failed to read page of news")
+            for news in page.items:
+                yield news
+            if not page.next_cursor:
+                return
+            after = (page.items[-1].created_at, page.items[-1].id)
+
+    async def get_by_uuid(self, news_id: UUID, projection: Projection | None = None) -> News | None:
         """
         Get news by uuid
         """
         query = """
-        select news::News {*, user: {*}} filter .id = <uuid>$news_id
+        select news::News %(shape)s filter .id = <uuid>$news_id
+        """ % {"shape": projection.shape if projection else NEWS_SHAPE}
+
+        try:
+            if news := await self.coalesced_query(query, news_id=news_id):
+                return make_pydantic_model(News, news[0])
+            return None
+        except edgedb.errors.EdgeDBError:
+            return None
+
+    async def get_by_ids(self, news_ids: list[UUID], projection: Projection | None = None) -> list[News] | None:
+        """
+        Get news by ids in one query, ordered as ids, missing news are skipped
+        """
+        query = """
+        select news::News %(shape)s filter .id in array_unpack(<array<uuid>>$news_ids)
+        """ % {"shape": projection.shape if projection else NEWS_SHAPE}
+
+        if not news_ids:
+            return []
+        try:
+            news = {item.id: item for item in await self.database.query(query, news_ids=news_ids)}
+        except edgedb.errors.EdgeDBError:
+            return None
+        return make_pydantic_models(News, (news[news_id] for news_id in news_ids if news_id in news))
+
+    async def get_version(self,
+                          news_id: UUID,
+                          variant: str | None = None) -> tuple[str, datetime.datetime | None] | None:
+        """
+        Get ETag and Last-Modified of news without loading it
+        """
+        query = """
+        select news::News {id, created_at, updated_at, user: {created_at, updated_at}} filter .id = <uuid>$news_id
         """
 
         try:
             if news := await self.database.query(query, news_id=news_id):
-                return news[0]
+                return news_validators(news[0], variant)
             return None
         except edgedb.errors.EdgeDBError:
             return None
 
+    async def _authors(self, news_ids: list[UUID]) -> dict[UUID, UUID]:
+        """
+        Author ids of news, for cache tags and timelines of writes.
+        Read without user globals, whose access policies hide the author of other users' news.
+        """
+        query = """
+        select news::News {id, user: {id}} filter .id in array_unpack(<array<uuid>>$news_ids)
+        """
+
+        return {item.id: item.user.id for item in await database_client.query(query, news_ids=news_ids)}
+
     async def create(self,
                      user_id: UUID,
                      title: str,
-                     content: str) -> News | None:
+                     content: str) -> CreateUpdateNewsResponseSchema | None:
         """
         Create news
         """
@@ -73,14 +351,18 @@ class NewsTDG(BaseTableDataGateway):
         """
 
         try:
-            return (await self.database.query(query, user_id=user_id, title=title, content=content))[0]
+            news = (await self.database.query(query, user_id=user_id, title=title, content=content))[0]
         except edgedb.errors.EdgeDBError:
             return None
+        await task_queue.enqueue(tasks.invalidate_responses, tags=["news-list", f"user:{user_id}"])
+        await task_queue.enqueue(tasks.add_to_timeline,
+                                 user_id=user_id, news=[(news.id, news.created_at.timestamp())])
+        return make_pydantic_model(CreateUpdateNewsResponseSchema, news)
 
     async def update(self,
                      news_id: UUID,
                      title: str | None = None,
-                     content: str | None = None) -> News | None:
+                     content: str | None = None) -> CreateUpdateNewsResponseSchema | None:
         """
         Update news
         """
@@ -96,20 +378,97 @@ class NewsTDG(BaseTableDataGateway):
         """
 
         try:
-            return (await self.database.query(query, news_id=news_id, title=title, content=content))[0]
+            authors = await self._authors([news_id])
+            news = (await self.database.query(query, news_id=news_id, title=title, content=content))[0]
         except edgedb.errors.EdgeDBError:
             return None
+        await task_queue.enqueue(tasks.invalidate_responses,
+                                 tags=["news-list", *news_cache_tags(news.id, authors[news.id])])
+        return make_pydantic_model(CreateUpdateNewsResponseSchema, news)
 
     async def delete(self, news_id: UUID) -> UUID | None:
         """
         Delete news
         """
         query = """
-        delete news::News filter .id = <uuid>$news_id
+        select (delete news::News filter .id = <uuid>$news_id) {id}
+        """
+
+        try:
+            authors = await self._authors([news_id])
+            news = await self.database.query(query, news_id=news_id)
+        except edgedb.errors.EdgeDBError:
+            return None
+        await task_queue.enqueue(tasks.invalidate_responses, tags=["news-list", f"news:{news_id}"])
+        await task_queue.enqueue(tasks.remove_from_timelines, news=[(item.id, authors[item.id]) for item in news])
+        return news_id
+
+    async def bulk_create(self, user_id: UUID, items: list[dict]) -> list[CreateUpdateNewsResponseSchema] | None:
+        """
+        Create many news by one statement, result is ordered as items
+        """
+        query = """
+        with
+            user := (select detached auth::User filter .id = <uuid>$user_id)
+        for item in json_array_unpack(<json>$items) union (
+            select (insert news::News {
+                user := user,
+                title := <str>item['title'],
+                content := <str>item['content']
+            }) {*, index := <int64>item['index']}
+        )
+        """
+
+        items = [{**item, "index": index} for index, item in enumerate(items)]
+        try:
+            news = await self.database.query(query, user_id=user_id, items=json.dumps(items))
+        except edgedb.errors.EdgeDBError:
+            return None
+        await task_queue.enqueue(tasks.invalidate_responses, tags=["news-list", f"user:{user_id}"])
+        await task_queue.enqueue(tasks.add_to_timeline,
+                                 user_id=user_id, news=[(item.id, item.created_at.timestamp()) for item in news])
+        return make_pydantic_models(CreateUpdateNewsResponseSchema, sorted(news, key=lambda item: item.index))
+
+    async def bulk_update(self, items: list[dict]) -> dict[UUID, CreateUpdateNewsResponseSchema] | None:
+        """
+        Update many news by one statement, result contains only found news
+        """
+        query = """
+        for item in json_array_unpack(<json>$items) union (
+            select (update news::News filter .id = <uuid>item['id'] set {
+                title := <str>json_get(item, 'title') ?? .title,
+                content := <str>json_get(item, 'content') ?? .content
+            }) {*}
+        )
+        """
+
+        try:
+            authors = await self._authors([item["id"] for item in items])
+            news = await self.database.query(query, items=json.dumps(items, default=str))
+        except edgedb.errors.EdgeDBError:
+            return None
+        await task_queue.enqueue(
+            tasks.invalidate_responses,
+            tags=["news-list", *(tag for item in news for tag in news_cache_tags(item.id, authors[item.id]))],
+        )
+        return {item.id: item for item in make_pydantic_models(CreateUpdateNewsResponseSchema, news)}
+
+    async def bulk_delete(self, news_ids: list[UUID]) -> set[UUID] | None:
+        """
+        Delete many news by one statement, result contains only found news
+        """
+        query = """
+        select (delete news::News filter .id in array_unpack(<array<uuid>>$news_ids)) {id}
         """
 
         try:
-            await self.database.query(query, news_id=news_id)
-            return news_id
+            authors = await self._authors(news_ids)
+            news = await self.database.query(query, news_ids=news_ids)
         except edgedb.errors.EdgeDBError:
             return None
+        await task_queue.enqueue(
+            tasks.invalidate_responses,
+            tags=["news-list", *(tag for item in news for tag in news_cache_tags(item.id, authors[item.id]))],
+        )
+        await task_queue.enqueue(tasks.remove_from_timelines, news=[(item.id, authors[item.id]) for item in news])
+        return {item.id for item in news}
@@ -0,0 +1,58 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+Background tasks run after news writes. Arguments arrive as JSON values.
+"""
+
+import datetime
+from uuid import UUID
+
+from simpleo.core.response_cache import response_cache
+from simpleo.core.tasks import task_queue
+from simpleo.news import timelines
+
+
+async def _responses_not_invalidated(tags: list[str]) -> None:
+    response_cache.invalidate_tags_later(*tags)
+
+
+@task_queue.task("news.invalidate_responses", needs_redis=True, on_lost=_responses_not_invalidated)
+async def invalidate_responses(tags: list[str]) -> None:
+    """
+    Drop cached responses by tags
+    :param tags:
+    :return:
+    """
+    await response_cache.invalidate_tags(*tags)
+
+
+async def _timeline_not_updated(user_id: str, news: list[tuple[str, float]]) -> None:
+    # pylint: disable=unused-argument
+    await timelines.invalidate()
+
+
+@task_queue.task("news.add_to_timeline", needs_redis=True, on_lost=_timeline_not_updated)
+async def add_to_timeline(user_id: str, news: list[tuple[str, float]]) -> None:
+    """
+    Add news to author timeline
+    :param user_id: Author
+    :param news: News ids with creation time as POSIX timestamp
+    :return:
+    """
+    await timelines.add(UUID(user_id), [
+        (UUID(news_id), datetime.datetime.fromtimestamp(created_at, tz=datetime.timezone.utc))
+        for news_id, created_at in news
+    ])
+
+
+@task_queue.task("news.remove_from_timelines", needs_redis=True)
+async def remove_from_timelines(news: list[tuple[str, str]]) -> None:
+    """
+    Remove news from timelines of their authors
+    :param news: News ids with author ids
+    :return:
+    """
+    await timelines.remove((UUID(news_id), UUID(user_id)) for news_id, user_id in news)
@@ -0,0 +1,199 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+Per-author news timelines.
+
+Every author has a Redis sorted set of news ids scored by created_at,
+maintained on write by background tasks. Author feeds are read from it by keyset and hydrated
+from EdgeDB by ids. Timelines are used only after they were built once
+(READY_KEY), otherwise and on Redis errors readers fall back to EdgeDB.
+A lost timeline update removes READY_KEY (see invalidate), timelines stay
+unused until the next rebuild.
+
+Rebuild: python -m simpleo.news.timelines rebuild
+"""
+
+import argparse
+import asyncio
+import datetime
+import logging
+import time
+from typing import Iterable
+from uuid import UUID
+
+from redis.exceptions import RedisError
+
+from simpleo.core.connections.redis import batch, redis
+from simpleo.core.pagination import KeysetCursor
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "news-timeline"
+READY_KEY = f"{KEY_PREFIX}s:ready"
+
+# READY_KEY must be removed but Redis was unavailable
+_invalidation_pending = False
+
+
+def _key(user_id: UUID) -> str:
+    return f"{KEY_PREFIX}:{user_id}"
+
+
+def _score(created_at: datetime.datetime) -> float:
+    return created_at.timestamp()
+
+
+async def add(user_id: UUID, news: Iterable[tuple[UUID, datetime.datetime]]) -> None:
+    """
+    Add news to author timeline
+    :param user_id: Author
+    :param news: News ids with creation time
+    :return:
+    """
+    if mapping := {str(news_id): _score(created_at) for news_id, created_at in news}:
+        await redis.zadd(_key(user_id), mapping)
+
+
+async def remove(news: Iterable[tuple[UUID, UUID]]) -> None:
+    """
+    Remove news from timelines of their authors
+    :param news: News ids with author ids
+    :return:
+    """
+    async with batch() as pipe:
+        for news_id, user_id in news:
+            pipe.zrem(_key(user_id), str(news_id))
+
+
+async def _remove_ready_key() -> bool:
+    global _invalidation_pending  # pylint: disable=global-statement
+    try:
+        await redis.delete(READY_KEY)
+    except RedisError:
+        return False
+    _invalidation_pending = False
+    return True
+
+
+async def invalidate() -> None:
+    """
+    Stop using timelines until the next rebuild, called when an update is lost.
+    If Redis is unavailable, removal of READY_KEY is retried on reads of this process.
+    :return:
+    """
+    global _invalidation_pending  # pylint: disable=global-statement
+    _invalidation_pending = True
+    logger.warning("News timeline update lost, timelines are not used until rebuild")
+    await _remove_ready_key()
+
+
+async def read(user_id: UUID,
+               limit: int,
+               after: KeysetCursor | None = None,
+               before: KeysetCursor | None = None) -> tuple[list[UUID], bool] | None:
+    """
+    Read page of author news ids, newest first, ordered as NewsTDG.get orders them
+    :param user_id: Author
+    :param limit: Page size
+    :param after: Key of the last item of previous page
+    :param before: Key of the first item of next page
+    :return: Ids and whether there are more in the reading direction, None if timeline can't be used
+    """
+    if after and before:
+        return None
+    if _invalidation_pending and not await _remove_ready_key():
+        return None
+    ascending = before is not None
+    cursor = before or after
+    key = _key(user_id)
+    try:
+        if not await redis.exists(READY_KEY):
+            return None
+        ids: list[UUID] = []
+        offset = 0
+        # Members with the cursor's score may be on either side of it, so they are filtered here
+        while len(ids) <= limit:
+            if ascending:
+                window = await redis.zrangebyscore(
+                    key, _score(cursor[0]), "+inf", start=offset, num=limit + 1, withscores=True
+                )
+            else:
+                window = await redis.zrevrangebyscore(
+                    key, _score(cursor[0]) if cursor else "+inf", "-inf", start=offset, num=limit + 1, withscores=True
+                )
+            for member, score in window:
+                news_id = UUID(member.decode("ascii"))
+                if cursor and score == _score(cursor[0]) and (news_id <= cursor[1] if ascending
+                                                               else news_id >= cursor[1]):
+                    continue
+                ids.append(news_id)
+            if len(window) <= limit:
+                break
+            offset += len(window)
+    except RedisError:
+        return None
+
+    has_more = len(ids) > limit
+    ids = ids[:limit]
+    if ascending:
+        ids.reverse()
+    return ids, has_more
+
+
+async def rebuild() -> int:
+    """
+    Regenerate all timelines from EdgeDB.
+    News created while rebuilding are kept, stale ids older than the rebuild are removed.
+    All news are read before Redis is changed, so a failed read (NewsIterationError)
+    leaves timelines and the ready marker untouched.
+    :return: Number of indexed news
+    """
+    # pylint: disable=import-outside-toplevel
+    from simpleo.news.table_data_gateways.news import NewsTDG, news_projection
+
+    started_at = time.time()
+    timelines: dict[UUID, dict[str, float]] = {}
+    # Must be a complete pass, the sweep below removes everything it didn't see
+    async for news in NewsTDG().iterate(projection=news_projection(frozenset({"id"}))):
+        timelines.setdefault(news.user.id, {})[str(news.id)] = _score(news.created_at)
+
+    async for key in redis.scan_iter(match=f"{KEY_PREFIX}:*"):
+        user_id = UUID(key.decode("ascii").removeprefix(f"{KEY_PREFIX}:"))
+        indexed = timelines.get(user_id, {})
+        stale = [member for member in await redis.zrangebyscore(key, "-inf", f"({started_at}")
+                 if member.decode("ascii") not in indexed]
+        if stale:
+            await redis.zrem(key, *stale)
+
+    for user_id, mapping in timelines.items():
+        await redis.zadd(_key(user_id), mapping)
+    await redis.set(READY_KEY, started_at)
+    return sum(map(len, timelines.values()))
+
+
+async def _main(command: str) -> None:
+    # pylint: disable=import-outside-toplevel
+    from simpleo.core.connections.edgedb import client as database_client
+    from simpleo.core.connections.redis import redis_manager
+    from simpleo.news.table_data_gateways.news import NewsIterationError
+
+    try:
+        if command == "rebuild":
+            started_at = time.perf_counter()
+            try:
+                count = await rebuild()
+            except NewsIterationError as error:
+                raise SystemExit(f"Rebuild aborted, timelines are unchanged: {error}") from error
+            print(f"Indexed {count} news in {time.perf_counter() - started_at:.1f} s")
+    finally:
+        await database_client.aclose()
+        await redis_manager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m simpleo.news.timelines", description="News timelines")
+    parser.add_argument("command", choices=("rebuild",))
+    asyncio.run(_main(parser.parse_args().command))
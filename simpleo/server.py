@@ -0,0 +1,109 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+Server entrypoint.
+
+Production mode runs several uvicorn workers, development mode runs one
+process with auto-reload. On SIGTERM workers stop accepting connections,
+wait for in-flight requests up to the graceful shutdown timeout and then
+run app shutdown, which closes the database pool after its transactions end.
+
+--max-requests is applied only to a single worker, which exits after that
+many requests and must be restarted by the container or process manager.
+The uvicorn supervisor does not respawn exited workers, so with several
+workers it is ignored, otherwise the service would stop once every worker
+reached the limit.
+"""
+
+import argparse
+import importlib.util
+import logging
+import os
+
+import uvicorn
+
+from simpleo.core.config import settings
+
+APP = "simpleo.app:app"
+
+logger = logging.getLogger(__name__)
+
+
+def default_workers() -> int:
+    """
+    Workers count from CPUs available to the process
+    :return:
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    return max(cpus, 1)
+
+
+def _available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    Command line options, defaults come from settings
+    :param argv:
+    :return:
+    """
+    parser = argparse.ArgumentParser(prog="simpleo", description="Run Simpleo API server")
+    parser.add_argument("--dev", action="store_true", help="Single process with auto-reload")
+    parser.add_argument("--host", default=settings.SERVER_BIND_HOST)
+    parser.add_argument("--port", type=int, default=settings.SERVER_BIND_PORT)
+    parser.add_argument("--workers", type=int, default=settings.SERVER_WORKERS,
+                        help="Worker processes, 0 means one per CPU")
+    parser.add_argument("--keep-alive", type=int, default=settings.SERVER_KEEP_ALIVE,
+                        help="Seconds to keep idle connections open")
+    parser.add_argument("--backlog", type=int, default=settings.SERVER_BACKLOG,
+                        help="Maximum number of pending connections")
+    parser.add_argument("--max-requests", type=int, default=settings.SERVER_MAX_REQUESTS,
+                        help="Exit single worker after this many requests, 0 disables, ignored with several workers")
+    parser.add_argument("--graceful-timeout", type=int, default=settings.SERVER_GRACEFUL_SHUTDOWN_TIMEOUT,
+                        help="Seconds to wait for in-flight requests on shutdown")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    Run server
+    :param argv:
+    :return:
+    """
+    args = parse_args(argv)
+    if args.dev:
+        uvicorn.run(APP, host=args.host, port=args.port, reload=True)
+        return
+
+    workers = args.workers or default_workers()
+    max_requests = args.max_requests or None
+    if max_requests and workers > 1:
+        logger.warning("--max-requests is ignored with %d workers, exited workers are not respawned", workers)
+        max_requests = None
+
+    uvicorn.run(
+        APP,
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        loop="uvloop" if _available("uvloop") else "asyncio",
+        http="httptools" if _available("httptools") else "h11",
+        timeout_keep_alive=args.keep_alive,
+        backlog=args.backlog,
+        limit_max_requests=max_requests,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        proxy_headers=True,
+        forwarded_allow_ips=settings.SERVER_FORWARDED_ALLOW_IPS,
+        server_header=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+Import-time regression test, settings are read from environment as for the app
+"""
+
+from simpleo.core.importtime import IMPORT_TIME_BUDGET_MS, measure, own_modules
+
+
+def test_import_time_budget() -> None:
+    modules, eager = measure()
+    own = own_modules(modules)
+    own_ms = sum(module.self_us for module in own) / 1000
+    slowest = ", ".join(f"{module.name} {module.self_us / 1000:.1f} ms" for module in own[:5])
+    assert own_ms <= IMPORT_TIME_BUDGET_MS, f"Own modules import in {own_ms:.1f} ms, slowest: {slowest}"
+    assert not eager, f"Created on import: {', '.join(eager)}"
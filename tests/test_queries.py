@@ -0,0 +1,64 @@
+#  Copyright (C) Simpleo - All Rights Reserved
+#  Unauthorized copying of this file, via any medium is strictly prohibited
+#  Proprietary and confidential
+#  Written by happykust - Kirill Nikolaevskiy <happykust@list.ru>, 2023
+
+"""
+Query budget and N+1 detection of the per-request query log
+"""
+
+import asyncio
+import logging
+
+import pytest
+
+from simpleo.core.config import settings
+from simpleo.core.queries import QueryBudgetExceeded, QueryLogMiddleware, record_query
+
+QUERY = "select news::News {*} filter .id = <uuid>$news_id"
+
+
+def request(queries: int) -> None:
+    """
+    Run GET request through QueryLogMiddleware, the endpoint records queries
+    """
+    async def endpoint(scope, receive, send) -> None:
+        for _ in range(queries):
+            record_query(QUERY, duration=0.001, rows=1)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def receive() -> dict:
+        return {"type": "http.request", "body": b""}
+
+    async def send(message: dict) -> None:
+        pass
+
+    scope = {"type": "http", "method": "GET", "path": "/news/", "headers": []}
+    asyncio.run(QueryLogMiddleware(endpoint)(scope, receive, send))
+
+
+@pytest.fixture
+def strict_budget(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "QUERY_BUDGET_MODE", "strict")
+    monkeypatch.setattr(settings, "QUERY_BUDGET", 3)
+
+
+@pytest.mark.usefixtures("strict_budget")
+def test_strict_budget_fails_request_over_budget() -> None:
+    with pytest.raises(QueryBudgetExceeded, match="GET /news/ exceeded query budget of 3"):
+        request(queries=4)
+
+
+@pytest.mark.usefixtures("strict_budget")
+def test_strict_budget_passes_request_within_budget() -> None:
+    request(queries=3)
+
+
+def test_repeated_query_is_reported_as_n_plus_one(monkeypatch: pytest.MonkeyPatch,
+                                                  caplog: pytest.LogCaptureFixture) -> None:
+    monkeypatch.setattr(settings, "QUERY_BUDGET_MODE", "off")
+    monkeypatch.setattr(settings, "N_PLUS_ONE_THRESHOLD", 2)
+    with caplog.at_level(logging.WARNING, logger="simpleo.core.queries"):
+        request(queries=2)
+    assert "Possible N+1 in GET /news/" in caplog.text